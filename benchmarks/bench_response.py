@@ -0,0 +1,206 @@
+"""
+Benchmarks for loading responses and folding model spectra through them,
+for the responses of all instruments in `data/`.
+
+The benchmarks follow the conventions of airspeed velocity (asv): `time_*`
+methods are timed, `peakmem_*` methods report the peak memory and
+`track_*` methods report the returned value (here the throughput). Run
+them with ``asv run --python=same`` (or ``asv dev``) from the top-level
+directory. Responses that have not been pulled from git lfs are skipped.
+"""
+import os
+import shutil
+import tempfile
+import timeit
+
+import numpy as np
+import astropy.io.fits as fits
+
+from clarsach.respond import RMF, ARF
+from clarsach.spectrum import XSpectrum
+from clarsach.models.powerlaw import Powerlaw
+from clarsach import _kernels
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        os.pardir, "data")
+
+# the responses of each instrument, as (RMF, ARF); the ARF is None for
+# instruments with a combined response
+RESPONSES = {"RXTE/PCA": ("PCU2.rsp", None),
+             "RXTE/HEXTE": ("rxte_hexte_97mar20c_pwa.rmf",
+                            "rxte_hexte_00may26_pwa.arf"),
+             "NICER": ("NICER_May2014_rbn.rsp", None),
+             "eXTP/LAD": ("LAD_40mod_200eV_rbn.rsp", None),
+             "eXTP/SFA": ("XTP_sfa_withSDD_rbn.rsp", None),
+             "Chandra/ACIS": ("rmfs/aciss_hetg0_cy19.rmf",
+                              "arfs/aciss_hetg0_cy19.arf"),
+             "Chandra/HETG": ("rmfs/aciss_heg1_cy19.grmf",
+                              "arfs/aciss_heg1_cy19.garf")}
+
+INSTRUMENTS = sorted(RESPONSES.keys())
+
+# the number of model spectra in a batched fold
+N_BATCH = 100
+
+
+def _data_file(name):
+    """
+    The path to the data file `name`; raises NotImplementedError, which
+    makes asv skip the benchmark, if the file is missing or only a git
+    lfs pointer.
+    """
+    if name is None:
+        return None
+
+    path = os.path.join(DATA_DIR, name)
+    if not os.path.exists(path):
+        raise NotImplementedError("%s does not exist" % path)
+    with open(path, "rb") as f:
+        if f.read(7) == b"version":
+            raise NotImplementedError("%s is a git lfs pointer" % path)
+
+    return path
+
+
+def _model(rmf, n=None):
+    pl = Powerlaw(norm=1.0, phoindex=2.0).bind(rmf.energ_lo, rmf.energ_hi)
+    if n is None:
+        return np.array(pl.evaluate())
+
+    params = np.column_stack([np.ones(n), np.linspace(1.5, 2.5, n)])
+    return np.array(pl.evaluate(params))
+
+
+def _throughput(func, n_spectra):
+    """
+    The number of model spectra folded per second by `func`.
+    """
+    number = 10
+    times = timeit.repeat(func, repeat=3, number=number)
+    return n_spectra * number / min(times)
+
+
+class LoadResponse(object):
+    """
+    Reading the RMF, from the FITS file and from the on-disk cache.
+    """
+    params = INSTRUMENTS
+    param_names = ["instrument"]
+
+    def setup(self, instrument):
+        self.rmffile = _data_file(RESPONSES[instrument][0])
+
+        self.cache_dir = tempfile.mkdtemp()
+        RMF(self.rmffile, cache_dir=self.cache_dir)
+
+    def teardown(self, instrument):
+        shutil.rmtree(self.cache_dir)
+
+    def time_load_rmf(self, instrument):
+        RMF(self.rmffile)
+
+    def time_load_rmf_from_cache(self, instrument):
+        RMF(self.rmffile, cache_dir=self.cache_dir)
+
+    def time_load_rmf_chunked(self, instrument):
+        RMF(self.rmffile, chunk_rows=256)
+
+    def peakmem_load_rmf(self, instrument):
+        RMF(self.rmffile)
+
+    def peakmem_load_rmf_chunked(self, instrument):
+        RMF(self.rmffile, chunk_rows=256)
+
+
+class LoadARF(object):
+    """
+    Reading the ARF, for the instruments that have one.
+    """
+    params = INSTRUMENTS
+    param_names = ["instrument"]
+
+    def setup(self, instrument):
+        arffile = RESPONSES[instrument][1]
+        if arffile is None:
+            raise NotImplementedError("%s has no ARF" % instrument)
+        self.arffile = _data_file(arffile)
+
+    def time_load_arf(self, instrument):
+        ARF(self.arffile)
+
+
+class FoldResponse(object):
+    """
+    Folding one and many model spectra through the RMF.
+    """
+    params = (INSTRUMENTS, ["numpy-sparse", "numba", "python"])
+    param_names = ["instrument", "backend"]
+
+    def setup(self, instrument, backend):
+        if backend == "numba" and not _kernels.HAS_NUMBA:
+            raise NotImplementedError("numba is not installed")
+
+        self.rmf = RMF(_data_file(RESPONSES[instrument][0]), backend=backend)
+        self.m = _model(self.rmf)
+        self.m_batch = _model(self.rmf, N_BATCH)
+
+    def time_apply_rmf(self, instrument, backend):
+        self.rmf.apply_rmf(self.m)
+
+    def time_apply_rmf_batched(self, instrument, backend):
+        self.rmf.apply_rmf(self.m_batch)
+
+    def peakmem_apply_rmf_batched(self, instrument, backend):
+        self.rmf.apply_rmf(self.m_batch)
+
+    def track_batched_throughput(self, instrument, backend):
+        return _throughput(lambda: self.rmf.apply_rmf(self.m_batch), N_BATCH)
+
+    track_batched_throughput.unit = "spectra/s"
+
+
+class ApplyResponse(object):
+    """
+    Folding model spectra through the full response of a spectrum,
+    end to end with `XSpectrum.apply_resp`.
+    """
+    params = INSTRUMENTS
+    param_names = ["instrument"]
+
+    def setup(self, instrument):
+        rmffile, arffile = RESPONSES[instrument]
+        rmffile = _data_file(rmffile)
+        arffile = _data_file(arffile)
+
+        hdulist = fits.open(rmffile)
+        ebounds = hdulist["EBOUNDS"]
+        e_min = np.array(ebounds.data.field("E_MIN"))
+        e_max = np.array(ebounds.data.field("E_MAX"))
+        hdulist.close()
+
+        rmf = RMF(rmffile)
+        arf = None if arffile is None else ARF(arffile)
+        self.spec = XSpectrum.from_arrays(e_min, e_max, rmf.energ_unit,
+                                          np.zeros(len(e_min)),
+                                          rmf=rmf, arf=arf, exposure=1e4)
+
+        self.m = _model(rmf)
+        self.m_batch = _model(rmf, N_BATCH)
+
+        # build the fused response outside of the timed code
+        self.spec.apply_resp(self.m)
+
+    def time_apply_resp(self, instrument):
+        self.spec.apply_resp(self.m)
+
+    def time_apply_resp_batched(self, instrument):
+        self.spec.apply_resp(self.m_batch)
+
+    def peakmem_apply_resp_batched(self, instrument):
+        self.spec.apply_resp(self.m_batch)
+
+    def track_batched_throughput(self, instrument):
+        return _throughput(lambda: self.spec.apply_resp(self.m_batch),
+                           N_BATCH)
+
+    track_batched_throughput.unit = "spectra/s"
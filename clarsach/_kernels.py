@@ -0,0 +1,94 @@
+# Compiled folding kernels, used when numba is installed
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+__all__ = ["HAS_NUMBA", "fold_groups", "unfold_groups"]
+
+HAS_NUMBA = numba is not None
+
+
+def _fold_groups(spec, grp_energy, grp_chan, n_chan, grp_start, matrix,
+                 counts):
+    """
+    Scatter-add a batch of spectra into channels, one channel group
+    at a time.
+
+    Parameters
+    ----------
+    spec : numpy.ndarray
+        The spectra to fold, of shape (n_models, n_energy)
+
+    grp_energy : numpy.ndarray
+        The energy bin of each channel group
+
+    grp_chan : numpy.ndarray
+        The first (zero-based) output channel of each channel group
+
+    n_chan : numpy.ndarray
+        The number of channels in each channel group
+
+    grp_start : numpy.ndarray
+        The index into `matrix` of the first element of each group
+
+    matrix : numpy.ndarray
+        The flattened redistribution matrix
+
+    counts : numpy.ndarray
+        The output array of shape (n_models, detchans), which is
+        added to in place
+    """
+    n_models = spec.shape[0]
+    detchans = counts.shape[1]
+    for g in range(grp_energy.shape[0]):
+        e = grp_energy[g]
+        for k in range(n_chan[g]):
+            c = grp_chan[g] + k
+            if c < 0 or c >= detchans:
+                continue
+            w = np.float64(matrix[grp_start[g] + k])
+            for m in range(n_models):
+                counts[m, c] += w * spec[m, e]
+
+
+def _unfold_groups(counts, grp_energy, grp_chan, n_chan, grp_start, matrix,
+                   spec):
+    """
+    Apply the transpose of the redistribution matrix to a batch of
+    channel-space vectors, one channel group at a time.
+
+    Parameters
+    ----------
+    counts : numpy.ndarray
+        The channel-space vectors, of shape (n_models, detchans)
+
+    grp_energy, grp_chan, n_chan, grp_start, matrix : numpy.ndarray
+        The channel groups, see `fold_groups`
+
+    spec : numpy.ndarray
+        The output array of shape (n_models, n_energy), which is
+        added to in place
+    """
+    n_models = counts.shape[0]
+    detchans = counts.shape[1]
+    for g in range(grp_energy.shape[0]):
+        e = grp_energy[g]
+        for k in range(n_chan[g]):
+            c = grp_chan[g] + k
+            if c < 0 or c >= detchans:
+                continue
+            w = np.float64(matrix[grp_start[g] + k])
+            for m in range(n_models):
+                spec[m, e] += w * counts[m, c]
+
+
+if HAS_NUMBA:
+    fold_groups = numba.njit(nogil=True, cache=True)(_fold_groups)
+    unfold_groups = numba.njit(nogil=True, cache=True)(_unfold_groups)
+else:
+    fold_groups = None
+    unfold_groups = None
@@ -0,0 +1,148 @@
+# On-disk cache for parsed responses
+
+import os
+import json
+import hashlib
+import shutil
+import tempfile
+
+import numpy as np
+
+__all__ = ["cache_path", "load_cache", "save_cache"]
+
+
+def cache_path(filename, cache_dir, variant=None):
+    """
+    The directory in `cache_dir` where the parsed version of `filename`
+    is stored.
+
+    The name is keyed on the absolute path, the size and the
+    modification time of the file, such that a changed file is
+    never read from a stale cache, and on `variant`.
+
+    Parameters
+    ----------
+    filename : str
+        The file name of the response file
+
+    cache_dir : str
+        The directory containing the cache
+
+    variant : str, default None
+        The variant of the parsed response, if it can be stored in
+        more than one way (e.g. "compact" for compact responses)
+
+    Returns
+    -------
+    path : str
+        The path of the cache entry for this file
+    """
+    filename = os.path.abspath(filename)
+    stat = os.stat(filename)
+    key = "%s:%d:%d" % (filename, stat.st_size, stat.st_mtime_ns
+                        if hasattr(stat, "st_mtime_ns")
+                        else int(stat.st_mtime * 1e9))
+    if variant is not None:
+        key += ":" + variant
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+    return os.path.join(cache_dir, os.path.basename(filename) + "-" + digest)
+
+
+def load_cache(filename, cache_dir, variant=None):
+    """
+    Load the cached arrays and attributes of a response file.
+
+    The arrays are memory-mapped read-only, such that processes
+    loading the same response share the same physical memory.
+
+    Parameters
+    ----------
+    filename : str
+        The file name of the response file
+
+    cache_dir : str
+        The directory containing the cache
+
+    variant : str, default None
+        The variant of the parsed response, see `cache_path`
+
+    Returns
+    -------
+    arrays : dict or None
+        The cached arrays, keyed by name, or None if there is no
+        cache entry for this file
+
+    attrs : dict or None
+        The cached (JSON-serializable) attributes
+    """
+    path = cache_path(filename, cache_dir, variant)
+    attrs_file = os.path.join(path, "attrs.json")
+    if not os.path.exists(attrs_file):
+        return None, None
+
+    with open(attrs_file, "r") as f:
+        attrs = json.load(f)
+
+    arrays = {}
+    for name in attrs.pop("__arrays__"):
+        arrays[name] = np.load(os.path.join(path, name + ".npy"),
+                               mmap_mode="r")
+
+    return arrays, attrs
+
+
+def save_cache(filename, cache_dir, arrays, attrs, variant=None):
+    """
+    Store the arrays and attributes of a parsed response file.
+
+    The entry is written to a temporary directory first and then
+    moved into place, so that concurrent processes never see a
+    partially written entry.
+
+    Parameters
+    ----------
+    filename : str
+        The file name of the response file
+
+    cache_dir : str
+        The directory containing the cache
+
+    arrays : dict
+        The arrays to store, keyed by name
+
+    attrs : dict
+        Additional JSON-serializable attributes to store
+
+    variant : str, default None
+        The variant of the parsed response, see `cache_path`
+    """
+    path = cache_path(filename, cache_dir, variant)
+    if os.path.exists(path):
+        return
+
+    if not os.path.exists(cache_dir):
+        try:
+            os.makedirs(cache_dir)
+        except OSError:
+            # somebody else may have created it in the meantime
+            if not os.path.isdir(cache_dir):
+                raise
+
+    tmp_path = tempfile.mkdtemp(dir=cache_dir)
+
+    for name, arr in arrays.items():
+        np.save(os.path.join(tmp_path, name + ".npy"), np.asarray(arr))
+
+    attrs = dict(attrs)
+    attrs["__arrays__"] = sorted(arrays.keys())
+    with open(os.path.join(tmp_path, "attrs.json"), "w") as f:
+        json.dump(attrs, f)
+
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # another process stored the same entry first
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+    return
@@ -0,0 +1,216 @@
+# Joint folding and likelihood of several spectra
+
+import numpy as np
+import scipy.sparse
+
+from clarsach.stats import poisson_loglike
+
+__all__ = ["JointSpectrum"]
+
+
+class JointSpectrum(object):
+    """
+    Several `XSpectrum` objects that are fit jointly, for example the
+    HEG/MEG +/-1 orders of a Chandra HETG observation.
+
+    The responses of all spectra are stacked into a single block
+    matrix that maps a model evaluated once on the union of all
+    energy grids to the channels of all spectra, so that folding and
+    computing the likelihood for all spectra is a single product.
+    The stacked response is always a scipy sparse matrix, so the
+    `backend` and `n_threads` of the RMFs do not apply to it; fold
+    each spectrum with `XSpectrum.apply_resp` to use them.
+
+    Parameters
+    ----------
+    spectra : iterable of XSpectrum
+        The spectra to fit jointly
+
+    exposure : float, default None
+        Override the exposure of all spectra (see `XSpectrum.apply_resp`)
+
+    Attributes
+    ----------
+    spectra : list of XSpectrum
+        The spectra
+
+    energ_lo, energ_hi : numpy.ndarray
+        The union of the energy grids of all spectra, on which the
+        model must be evaluated
+
+    counts : numpy.ndarray
+        The counts in the noticed channels of all spectra, concatenated
+
+    chan_bounds : numpy.ndarray
+        The counts of spectrum i are in
+        `counts[chan_bounds[i]:chan_bounds[i+1]]`
+
+    resp : scipy.sparse.csr_matrix
+        The stacked response of shape (len(energ_lo), len(counts))
+    """
+    def __init__(self, spectra, exposure=None):
+        self.spectra = list(spectra)
+        self.exposure = exposure
+
+        self._build_response()
+
+    def _build_response(self):
+        """
+        Build the union energy grid and the stacked response.
+        """
+        grids = [self._energy_grid(s) for s in self.spectra]
+
+        # the union of all energy bins, and where each spectrum's
+        # bins are in the union grid
+        edges = np.vstack([np.column_stack(g) for g in grids])
+        union, union_idx = np.unique(edges, axis=0, return_inverse=True)
+        union_idx = np.ravel(union_idx)
+        self.energ_lo = union[:, 0]
+        self.energ_hi = union[:, 1]
+
+        n_energy = np.cumsum([0] + [len(g[0]) for g in grids])
+
+        rows, cols, data = [], [], []
+        counts = []
+        chan_bounds = [0]
+        for i, s in enumerate(self.spectra):
+            resp = s._fused_response(exposure=self.exposure).tocoo()
+            idx = union_idx[n_energy[i]:n_energy[i+1]]
+
+            rows.append(idx[resp.row])
+            cols.append(resp.col + chan_bounds[-1])
+            data.append(resp.data)
+
+            counts.append(np.asarray(s.noticed_counts, dtype=np.float64))
+            chan_bounds.append(chan_bounds[-1] + resp.shape[1])
+
+        self.counts = np.hstack(counts)
+        self.chan_bounds = np.array(chan_bounds)
+
+        self.resp = scipy.sparse.coo_matrix((np.hstack(data),
+                                             (np.hstack(rows),
+                                              np.hstack(cols))),
+                                            shape=(len(self.energ_lo),
+                                                   chan_bounds[-1]))
+        self.resp = self.resp.tocsr()
+
+        return
+
+    def _energy_grid(self, spec):
+        """
+        The energy grid on which the model for `spec` is evaluated.
+        """
+        if spec.model_grid is not None:
+            return spec.model_grid
+        if spec.arf is not None:
+            return np.asarray(spec.arf.e_low), np.asarray(spec.arf.e_high)
+        return np.asarray(spec.rmf.energ_lo), np.asarray(spec.rmf.energ_hi)
+
+    def _model_flux(self, model):
+        """
+        Evaluate `model` on the union energy grid, if it isn't an
+        array of flux values already.
+        """
+        if hasattr(model, "calculate"):
+            return model.calculate(self.energ_lo, self.energ_hi)
+        return np.asarray(model, dtype=np.float64)
+
+    def apply_resp(self, model):
+        """
+        Fold a model through the responses of all spectra.
+
+        Parameters
+        ----------
+        model : numpy.ndarray or model object
+            The model flux on the union energy grid `energ_lo`,
+            `energ_hi`, of shape (n_energy,) or (n_models, n_energy);
+            or a model with a `calculate(ener_lo, ener_hi)` method,
+            which is evaluated on that grid
+
+        Returns
+        -------
+        count_model : numpy.ndarray
+            The folded model for all spectra, concatenated along the
+            last axis (see `split`)
+        """
+        mflux = self._model_flux(model)
+        return self.resp.T.dot(mflux.T).T
+
+    def apply_resp_adjoint(self, counts):
+        """
+        Apply the transpose of the stacked response to a vector in the
+        (concatenated) channel space of all spectra, e.g. to turn the
+        gradient of the joint likelihood with respect to the folded
+        models into the gradient with respect to the model flux.
+
+        Parameters
+        ----------
+        counts : numpy.ndarray
+            The channel-space vector, of shape (n_channels,) or
+            (n_models, n_channels)
+
+        Returns
+        -------
+        grad : numpy.ndarray
+            The result on the union energy grid, of shape (n_energy,)
+            or (n_models, n_energy)
+        """
+        counts = np.asarray(counts, dtype=np.float64)
+        return self.resp.dot(counts.T).T
+
+    def split(self, count_model):
+        """
+        Split concatenated channel arrays into one array per spectrum.
+
+        Parameters
+        ----------
+        count_model : numpy.ndarray
+            An array of channel values for all spectra, concatenated
+            along the last axis
+
+        Returns
+        -------
+        count_models : list of numpy.ndarray
+            The channel values for each spectrum
+        """
+        return np.split(count_model, self.chan_bounds[1:-1], axis=-1)
+
+    def loglikelihood(self, count_model):
+        """
+        The Poisson log-likelihood of the counts in all spectra,
+        given the folded model.
+
+        Parameters
+        ----------
+        count_model : numpy.ndarray
+            The folded model for all spectra, of shape (n_channels,)
+            or (n_models, n_channels)
+
+        Returns
+        -------
+        loglike : float or numpy.ndarray
+            The log-likelihood summed over all spectra, of shape
+            () or (n_models,)
+        """
+        return poisson_loglike(self.counts, count_model)
+
+    def evaluate(self, model):
+        """
+        Fold a model through all responses and compute the joint
+        log-likelihood in one go.
+
+        Parameters
+        ----------
+        model : numpy.ndarray or model object
+            The model flux on the union energy grid, see `apply_resp`
+
+        Returns
+        -------
+        count_models : list of numpy.ndarray
+            The folded model for each spectrum
+
+        loglike : float or numpy.ndarray
+            The log-likelihood summed over all spectra
+        """
+        count_model = self.apply_resp(model)
+        return self.split(count_model), self.loglikelihood(count_model)
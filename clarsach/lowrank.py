@@ -0,0 +1,220 @@
+import numpy as np
+import scipy.sparse
+import scipy.sparse.linalg
+
+__all__ = ["LowRankResponse"]
+
+# the number of rows of the response compared at a time
+# when computing the residual of the approximation
+_BLOCK_ROWS = 1024
+
+# the number of singular values computed first; it is doubled
+# until the tolerance is reached
+_INITIAL_RANK = 16
+
+
+class LowRankResponse(object):
+    """
+    A low-rank approximation to a response matrix, from its truncated
+    singular value decomposition.
+
+    A response of shape (n_energy, n_channels) is approximated by the
+    product of two thin factors of shapes (n_energy, rank) and
+    (rank, n_channels), so that folding a spectrum costs
+    O((n_energy + n_channels) * rank) rather than the number of
+    non-zero elements of the response. This is useful for e.g. quick
+    scans over a grid of models, where some loss of accuracy is fine.
+
+    The rank is the smallest one for which the largest discarded
+    singular value is at most `tol` times the largest singular value,
+    which bounds the error of a folded spectrum in the 2-norm. The
+    achieved accuracy per element is reported in `max_residual`.
+
+    The singular values are computed with a sparse solver, for an
+    increasing number of them until the tolerance is reached, so the
+    response is never converted to a dense matrix unless (almost) all
+    singular values are needed, in which case the factors are as large
+    as the dense matrix anyway.
+    """
+
+    def __init__(self, matrix, tol=1e-3, max_rank=None):
+        """
+        Parameters
+        ----------
+        matrix : scipy.sparse matrix or numpy.ndarray
+            The response, of shape (n_energy, n_channels), e.g.
+            `RMF.sparse_matrix`
+
+        tol : float, default 1e-3
+            The largest discarded singular value, relative to the largest
+            singular value
+
+        max_rank : int, default None
+            If given, the rank is at most `max_rank`, even if `tol`
+            is not reached
+
+        Attributes
+        ----------
+        matrix : scipy.sparse matrix or numpy.ndarray
+            The exact response
+
+        left : numpy.ndarray
+            The factor of shape (n_energy, rank), the left singular
+            vectors scaled by the singular values
+
+        right : numpy.ndarray
+            The factor of shape (rank, n_channels), the right
+            singular vectors
+
+        rank : int
+            The rank of the approximation
+
+        singular_values : numpy.ndarray
+            The largest singular values of the response in decreasing
+            order; these include the largest discarded one, unless all
+            singular values are kept
+
+        max_residual : float
+            The largest absolute difference between an element of the
+            response and of its approximation, relative to the largest
+            absolute element of the response. This is also the largest
+            error, relative to the peak of the exact folded spectrum,
+            when folding a spectrum that is non-zero in one energy bin.
+        """
+        if tol < 0:
+            raise ValueError("The tolerance must not be negative.")
+
+        if scipy.sparse.issparse(matrix):
+            exact = scipy.sparse.csr_matrix(matrix)
+        else:
+            exact = np.asarray(matrix)
+        if exact.dtype != np.float64:
+            exact = exact.astype(np.float64)
+
+        u, s, vt = _truncated_svd(exact, tol, max_rank)
+
+        rank = len(s)
+        if s.size and s[0] > 0:
+            # the largest discarded singular value is s[rank]
+            rank = int(np.searchsorted(-s[1:], -tol * s[0], side="left")) + 1
+        if max_rank is not None:
+            rank = min(rank, max_rank)
+
+        self.matrix = matrix
+        self.tol = tol
+        self.rank = rank
+        self.singular_values = s
+        self.left = np.ascontiguousarray(u[:, :rank] * s[:rank])
+        self.right = np.ascontiguousarray(vt[:rank])
+
+        self.max_residual = self._max_residual(exact)
+
+    def _max_residual(self, exact):
+        """
+        The largest element-wise residual of the approximation, relative
+        to the largest element of the response, computed in blocks of
+        rows to limit the memory used.
+        """
+        if scipy.sparse.issparse(exact):
+            values = exact.data
+        else:
+            values = exact
+        scale = np.max(np.abs(values)) if values.size else 0.0
+        if scale == 0:
+            return 0.0
+
+        residual = 0.0
+        for i in range(0, exact.shape[0], _BLOCK_ROWS):
+            rows = exact[i:i+_BLOCK_ROWS]
+            if scipy.sparse.issparse(rows):
+                rows = rows.toarray()
+            block = self.left[i:i+_BLOCK_ROWS].dot(self.right)
+            block -= rows
+            residual = max(residual, np.max(np.abs(block)))
+
+        return residual / scale
+
+    @property
+    def shape(self):
+        return (self.left.shape[0], self.right.shape[1])
+
+    def apply(self, spec):
+        """
+        Fold a spectrum through the approximate response.
+
+        Parameters
+        ----------
+        spec : numpy.ndarray
+            The (model) spectrum to be folded, of shape (n_energy,) or
+            (n_models, n_energy)
+
+        Returns
+        -------
+        counts : numpy.ndarray
+            The folded spectrum, of shape (n_channels,) or
+            (n_models, n_channels)
+        """
+        spec = np.asarray(spec, dtype=np.float64)
+        return spec.dot(self.left).dot(self.right)
+
+    def residual(self, spec):
+        """
+        The largest difference between the spectrum folded through the
+        exact response and through the approximation, relative to the
+        largest absolute value of the exactly folded spectrum.
+
+        Parameters
+        ----------
+        spec : numpy.ndarray
+            The (model) spectrum to be folded, of shape (n_energy,) or
+            (n_models, n_energy)
+
+        Returns
+        -------
+        residual : float
+            The relative residual
+        """
+        spec = np.asarray(spec, dtype=np.float64)
+        exact = self.matrix.T.dot(spec.T).T
+
+        scale = np.max(np.abs(exact))
+        if scale == 0:
+            return 0.0
+
+        return np.max(np.abs(self.apply(spec) - exact)) / scale
+
+    def apply_transpose(self, counts):
+        """
+        Apply the transpose of the approximate response to a vector in
+        channel space, see `RMF.apply_rmf_transpose`.
+        """
+        counts = np.asarray(counts, dtype=np.float64)
+        return counts.dot(self.right.T).dot(self.left.T)
+
+
+def _truncated_svd(matrix, tol, max_rank):
+    """
+    The largest singular values and vectors of `matrix`, in decreasing
+    order: at least until one of them is at most `tol` times the largest
+    one, or until there are more than `max_rank` of them.
+    """
+    n_max = min(matrix.shape)
+
+    k = _INITIAL_RANK
+    while True:
+        if k >= n_max - 1:
+            # the sparse solver can not compute all singular values
+            if scipy.sparse.issparse(matrix):
+                matrix = matrix.toarray()
+            return np.linalg.svd(matrix, full_matrices=False)
+
+        u, s, vt = scipy.sparse.linalg.svds(matrix, k=k)
+        order = np.argsort(s)[::-1]
+        u, s, vt = u[:, order], s[order], vt[order]
+
+        if s[0] == 0 or s[-1] <= tol * s[0]:
+            return u, s, vt
+        if max_rank is not None and k > max_rank:
+            return u, s, vt
+
+        k *= 2
@@ -1 +1,4 @@
+from clarsach.models.model import *
 from clarsach.models.powerlaw import *
+from clarsach.models.gaussian import *
+from clarsach.models.absorption import *
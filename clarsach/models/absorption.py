@@ -0,0 +1,130 @@
+import os
+import threading
+
+import numpy as np
+import astropy.io.fits as fits
+
+from clarsach.models.model import Model, DEFAULT_CACHE_SIZE
+
+__all__ = ['TabulatedAbsorption', 'load_cross_sections']
+
+# cross-section tables read so far, by absolute path and modification time
+_TABLES = {}
+_TABLES_LOCK = threading.Lock()
+
+
+def load_cross_sections(filename):
+    """
+    Read a table of photoabsorption cross sections. Each file is read
+    only once; later calls return the same (read-only) arrays.
+
+    The table is either a FITS file whose first table extension has the
+    columns ENERGY [keV] and SIGMA [cm^2 per hydrogen atom], or a text
+    file with the same two columns.
+
+    Parameters
+    ----------
+    filename : str
+        The path to the table
+
+    Returns
+    -------
+    energy, sigma : numpy.ndarray
+        The energies and cross sections of the table, sorted by energy
+    """
+    path = os.path.abspath(filename)
+    key = (path, os.stat(path).st_mtime)
+
+    with _TABLES_LOCK:
+        if key not in _TABLES:
+            _TABLES[key] = _read_table(path)
+
+    return _TABLES[key]
+
+
+def _read_table(path):
+    if path.lower().endswith((".fits", ".fit", ".fits.gz")):
+        hdulist = fits.open(path)
+        data = hdulist[1].data
+        energy = np.array(data.field("ENERGY"), dtype=np.float64)
+        sigma = np.array(data.field("SIGMA"), dtype=np.float64)
+        hdulist.close()
+    else:
+        energy, sigma = np.loadtxt(path, usecols=(0, 1), unpack=True)
+
+    order = np.argsort(energy)
+    energy = energy[order]
+    sigma = sigma[order]
+
+    energy.flags.writeable = False
+    sigma.flags.writeable = False
+
+    return energy, sigma
+
+
+class TabulatedAbsorption(Model):
+    """
+    Photoelectric absorption, exp(-nh * sigma(E)), with the cross sections
+    sigma(E) interpolated from a table.
+
+    The table is interpolated (in log-log space) onto the centres of the
+    energy bins once, when the model is bound to a grid; evaluating the
+    model for a batch of column densities is then a single exponential.
+    The table is not extrapolated: binding the model to a grid with bin
+    centres outside the energy range of the table raises a ValueError.
+    """
+    param_names = ['nh']
+    additive = False
+
+    def __init__(self, table, nh=0.1, cache_size=DEFAULT_CACHE_SIZE):
+        """
+        Parameters
+        ----------
+        table : str or tuple of numpy.ndarray
+            The file with the cross-section table (see
+            `load_cross_sections`), or the arrays (energy, sigma) with
+            energies in keV and cross sections in cm^2 per hydrogen atom
+        nh : float
+            Equivalent hydrogen column density [10^22 atoms cm^-2]
+        cache_size : int, default 16
+            The number of parameter sets whose spectra are kept
+
+        Attributes
+        ----------
+        nh : float
+        energy, sigma : numpy.ndarray
+            The cross-section table
+        """
+        Model.__init__(self, cache_size=cache_size)
+
+        if isinstance(table, str):
+            self.energy, self.sigma = load_cross_sections(table)
+        else:
+            energy, sigma = table
+            order = np.argsort(energy)
+            self.energy = np.asarray(energy, dtype=np.float64)[order]
+            self.sigma = np.asarray(sigma, dtype=np.float64)[order]
+
+        self.nh = nh
+
+        self._sigma_grid = None
+
+    def _bind(self):
+        ener_mid = 0.5 * (self.ener_lo + self.ener_hi)
+        if ener_mid.size and (np.min(ener_mid) < self.energy[0] or
+                              np.max(ener_mid) > self.energy[-1]):
+            self.ener_lo = self.ener_hi = None
+            raise ValueError("The energy grid extends beyond the cross-"
+                             "section table, which covers %g to %g keV." %
+                             (self.energy[0], self.energy[-1]))
+
+        log_sigma = np.interp(np.log(ener_mid), np.log(self.energy),
+                              np.log(self.sigma))
+
+        # in units of the column density, 10^22 atoms cm^-2
+        self._sigma_grid = 1e22 * np.exp(log_sigma)
+
+        return
+
+    def _evaluate(self, nh):
+        return np.exp(-nh * self._sigma_grid)
@@ -0,0 +1,46 @@
+import numpy as np
+import scipy.special
+
+from clarsach.models.model import Model, DEFAULT_CACHE_SIZE
+
+__all__ = ['Gaussian']
+
+class Gaussian(Model):
+    """
+    Gaussian line flux spectrum
+    """
+    param_names = ['norm', 'line_e', 'sigma']
+
+    def __init__(self, norm=1.0, line_e=6.4, sigma=0.1,
+                 cache_size=DEFAULT_CACHE_SIZE):
+        """
+        Parameters
+        ----------
+        norm : float
+            Total photon flux in the line [phot cm^-2 s^-1]
+        line_e : float
+            Line energy [keV]
+        sigma : float
+            Line width [keV]
+        cache_size : int, default 16
+            The number of parameter sets whose spectra are kept
+
+        Attributes
+        ----------
+        norm : float
+        line_e : float
+        sigma : float
+        """
+        Model.__init__(self, cache_size=cache_size)
+
+        self.norm   = norm
+        self.line_e = line_e
+        self.sigma  = sigma
+
+    def _evaluate(self, norm, line_e, sigma):
+        # integral of the line over each bin
+        scale = 1.0 / (np.sqrt(2.0) * sigma)
+        r = 0.5 * norm * (scipy.special.erf((self.ener_hi - line_e) * scale) -
+                          scipy.special.erf((self.ener_lo - line_e) * scale))
+
+        return r
@@ -0,0 +1,294 @@
+from collections import OrderedDict
+
+import numpy as np
+
+__all__ = ['Model', 'CompoundModel']
+
+# number of parameter sets whose model spectra are kept
+DEFAULT_CACHE_SIZE = 16
+
+
+class Model(object):
+    """
+    Base class for flux models evaluated on a fixed energy grid.
+
+    The model is bound to a grid once with `bind`, which precomputes the
+    logarithms of the bin edges, and can then be evaluated for a single
+    parameter set or for an array of parameter sets at once. The model
+    spectra of the last `cache_size` parameter sets are kept, so repeated
+    evaluations at the same point (e.g. by a sampler) are free.
+
+    Subclasses list their parameters in `param_names`, keep their values
+    in attributes of the same names and implement `_evaluate`. Additive
+    models give a flux per bin, multiplicative models (`additive = False`)
+    a dimensionless factor per bin; models combine with `+` and `*` into
+    a `CompoundModel`.
+    """
+    param_names = []
+    additive = True
+
+    def __init__(self, cache_size=DEFAULT_CACHE_SIZE):
+        """
+        Parameters
+        ----------
+        cache_size : int, default 16
+            The number of parameter sets whose model spectra are kept
+
+        Attributes
+        ----------
+        ener_lo, ener_hi : numpy.ndarray
+            The energy grid the model is bound to, or None
+
+        log_ener_lo, log_ener_hi : numpy.ndarray
+            The logarithms of the bin edges
+        """
+        self.cache_size = cache_size
+
+        self.ener_lo = None
+        self.ener_hi = None
+        self.log_ener_lo = None
+        self.log_ener_hi = None
+
+        self._cache = OrderedDict()
+
+    @property
+    def n_params(self):
+        return len(self.param_names)
+
+    @property
+    def params(self):
+        """
+        The current parameter values, in the order of `param_names`.
+        """
+        return np.array([getattr(self, name) for name in self.param_names],
+                        dtype=np.float64)
+
+    def bind(self, ener_lo, ener_hi):
+        """
+        Bind the model to an energy grid.
+
+        Parameters
+        ----------
+        ener_lo : numpy.ndarray
+            Low energy edge of counts histogram
+
+        ener_hi : numpy.ndarray
+            High energy edge of counts histogram
+
+        Returns
+        -------
+        self : Model
+            The model, bound to the grid
+        """
+        assert len(ener_lo) == len(ener_hi)
+
+        ener_lo = np.asarray(ener_lo, dtype=np.float64)
+        ener_hi = np.asarray(ener_hi, dtype=np.float64)
+        self._set_grid(ener_lo, ener_hi, np.log(ener_lo), np.log(ener_hi))
+
+        return self
+
+    def _set_grid(self, ener_lo, ener_hi, log_ener_lo, log_ener_hi):
+        self.ener_lo = ener_lo
+        self.ener_hi = ener_hi
+        self.log_ener_lo = log_ener_lo
+        self.log_ener_hi = log_ener_hi
+
+        self._cache.clear()
+        self._bind()
+
+        return
+
+    def _bind(self):
+        """
+        Precompute grid-dependent quantities; called by `bind`.
+        """
+        return
+
+    def is_bound_to(self, ener_lo, ener_hi):
+        """
+        Whether the model is bound to the energy grid `ener_lo`, `ener_hi`.
+        """
+        if self.ener_lo is None:
+            return False
+        if ener_lo is self.ener_lo and ener_hi is self.ener_hi:
+            return True
+
+        return np.array_equal(ener_lo, self.ener_lo) and \
+               np.array_equal(ener_hi, self.ener_hi)
+
+    def evaluate(self, params=None):
+        """
+        Evaluate the model on the bound energy grid.
+
+        Parameters
+        ----------
+        params : iterable of shape (n_params,) or (n_sets, n_params)
+            One or more parameter sets, in the order of `param_names`;
+            default are the current parameter values
+
+        Returns
+        -------
+        flux : numpy.ndarray of shape (n_bins,) or (n_sets, n_bins)
+            The flux spectra [phot cm^-2 s^-1]. The array is shared with
+            the cache of the model and therefore read-only.
+        """
+        if self.ener_lo is None:
+            raise ValueError("The model is not bound to an energy grid; "
+                             "call bind() first.")
+
+        if params is None:
+            params = self.params
+        params = np.asarray(params, dtype=np.float64)
+        if params.ndim not in (1, 2) or params.shape[-1] != self.n_params:
+            raise ValueError("Expected parameter sets of %i parameters, "
+                             "got an array of shape %s."
+                             % (self.n_params, str(params.shape)))
+
+        key = (params.shape, params.tobytes())
+        if key in self._cache:
+            # mark the entry as most recently used
+            flux = self._cache.pop(key)
+            self._cache[key] = flux
+            return flux
+
+        # each parameter as a column, so it broadcasts against the grid
+        p = np.atleast_2d(params)
+        flux = self._evaluate(*[p[:, i:i+1] for i in range(self.n_params)])
+        if params.ndim == 1:
+            flux = flux[0]
+        flux.flags.writeable = False
+
+        if self.cache_size > 0:
+            self._cache[key] = flux
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+        return flux
+
+    def _evaluate(self, *params):
+        """
+        The flux spectra for the parameter sets `params`, each of shape
+        (n_sets, 1), on the bound grid, as an array of shape (n_sets, n_bins).
+        """
+        raise NotImplementedError
+
+    def calculate(self, ener_lo, ener_hi):
+        """
+        Calculates the photon flux spectrum [phot cm^-2 s^-1] for the
+        current parameter values, binding the model to the energy grid
+        first if needed.
+
+        Parameters
+        ----------
+        ener_lo : numpy.ndarray
+            Low energy edge of counts histogram
+
+        ener_hi : numpy.ndarray
+            High energy edge of counts histogram
+
+        Returns
+        -------
+        flux : numpy.ndarray
+            The flux spectrum, as a new array; use `evaluate` to get
+            the cached (read-only) array without copying it
+        """
+        if not self.is_bound_to(ener_lo, ener_hi):
+            self.bind(ener_lo, ener_hi)
+
+        return np.array(self.evaluate())
+
+    def __add__(self, other):
+        return CompoundModel(self, other, "+")
+
+    def __mul__(self, other):
+        return CompoundModel(self, other, "*")
+
+
+class CompoundModel(Model):
+    """
+    The sum or product of two models, e.g. ``(absorption * powerlaw) +
+    gaussian``.
+
+    The parameters are those of the components, from left to right, named
+    ``<component>.<parameter>`` (e.g. ``powerlaw.phoindex``); components
+    of the same class are numbered (``powerlaw1``, ``powerlaw2``). An
+    array of parameter sets is evaluated for all components in one pass.
+    Binding the compound model binds its components to the same grid.
+    """
+
+    def __init__(self, left, right, op, cache_size=DEFAULT_CACHE_SIZE):
+        """
+        Parameters
+        ----------
+        left, right : Model
+            The models to combine
+
+        op : {"+", "*"}
+            Whether to add or to multiply the models. Only additive
+            models can be added, and at most one side of a product can
+            be additive.
+
+        cache_size : int, default 16
+            The number of parameter sets whose model spectra are kept
+        """
+        if op == "+":
+            if not (left.additive and right.additive):
+                raise ValueError("Only additive models can be added.")
+            additive = True
+        elif op == "*":
+            if left.additive and right.additive:
+                raise ValueError("Two additive models cannot be multiplied.")
+            additive = left.additive or right.additive
+        else:
+            raise ValueError("Unknown operator %s." % op)
+
+        Model.__init__(self, cache_size=cache_size)
+
+        self.left = left
+        self.right = right
+        self.op = op
+        self.additive = additive
+
+        self.components = _components(left) + _components(right)
+        self.param_names = _qualified_names(self.components)
+
+    @property
+    def params(self):
+        return np.concatenate([self.left.params, self.right.params])
+
+    def _bind(self):
+        for c in self.components:
+            c._set_grid(self.ener_lo, self.ener_hi,
+                        self.log_ener_lo, self.log_ener_hi)
+
+        return
+
+    def _evaluate(self, *params):
+        n_left = self.left.n_params
+        left = self.left._evaluate(*params[:n_left])
+        right = self.right._evaluate(*params[n_left:])
+
+        if self.op == "+":
+            return left + right
+        else:
+            return left * right
+
+
+def _components(model):
+    if isinstance(model, CompoundModel):
+        return list(model.components)
+    return [model]
+
+
+def _qualified_names(components):
+    labels = [type(c).__name__.lower() for c in components]
+
+    names = []
+    for i, c in enumerate(components):
+        label = labels[i]
+        if labels.count(label) > 1:
+            label += str(labels[:i+1].count(label))
+        names.extend(["%s.%s" % (label, p) for p in c.param_names])
+
+    return names
@@ -1,12 +1,16 @@
 import numpy as np
 
+from clarsach.models.model import Model, DEFAULT_CACHE_SIZE
+
 __all__ = ['Powerlaw']
 
-class Powerlaw(object):
+class Powerlaw(Model):
     """
     Powerlaw flux spectrum
     """
-    def __init__(self, norm=1.0, phoindex=2.0):
+    param_names = ['norm', 'phoindex']
+
+    def __init__(self, norm=1.0, phoindex=2.0, cache_size=DEFAULT_CACHE_SIZE):
         """
         Parameters
         ----------
@@ -14,6 +18,8 @@ class Powerlaw(object):
             Flux normalization for power law
         phoindex : float
             Photon index for power law spectrum
+        cache_size : int, default 16
+            The number of parameter sets whose spectra are kept
 
         Attributes
         ----------
@@ -21,32 +27,19 @@ class Powerlaw(object):
         phoindex : float
         calculate : function
         """
+        Model.__init__(self, cache_size=cache_size)
+
         self.norm     = norm      # Normalization for the power law [phot cm^-2 s^-1]
         self.phoindex = phoindex  # Photon Index for power law [unitless]
 
-    def calculate(self, ener_lo, ener_hi):
-        """
-        Calculates the photon flux spectrum [phot cm^-2 s^-1]
-
-        Parameters
-        ----------
-        ener_lo : numpy.ndarray
-            Low energy edge of counts histogram
+    def _evaluate(self, norm, phoindex):
+        # integral over the power law model, with
+        # ener**(1-phoindex) = exp((1-phoindex) * log(ener))
+        r = -norm * np.exp((-phoindex + 1) * self.log_ener_hi) + \
+            norm * np.exp((-phoindex + 1) * self.log_ener_lo)
 
-        ener_hi : numpy.ndarray
-            High energy edge of counts histogram
+        is_one = phoindex == 1.0
+        if np.any(is_one):
+            r = np.where(is_one, self.log_ener_hi - self.log_ener_lo, r)
 
-        Returns
-        -------
-        Flux = norm * np.power(emid, -phoindex) where emid = 0.5 * (ener_lo + ener_hi) and has units of keV
-        """
-        assert len(ener_lo) == len(ener_hi)
-        # Computes flux spectrum [phot cm^-2 s^-1] for given energy grid
-
-        # integral over the power law model
-        if self.phoindex == 1.0:
-            r = np.log(ener_hi) - np.log(ener_lo)
-        else:
-            r = -self.norm * ener_hi**(-self.phoindex+1) + \
-                self.norm * ener_lo**(-self.phoindex+1)
         return r
@@ -0,0 +1,231 @@
+"""
+Fit many spectra in parallel processes that share their responses.
+
+Catalogs of spectra typically use only a handful of responses. Rather
+than pickling the responses to every worker process, `fit_catalog`
+places the arrays of each distinct RMF and ARF in shared memory once,
+and the workers create read-only views of them without copying. The
+spectra are sent to the workers in chunks, and the results are returned
+as soon as each chunk is done.
+
+Requires Python 3.8 or later for `multiprocessing.shared_memory`.
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+try:
+    from multiprocessing import shared_memory
+    HAS_SHARED_MEMORY = True
+except ImportError:
+    HAS_SHARED_MEMORY = False
+
+from clarsach.respond import RMF
+from clarsach.spectrum import XSpectrum
+
+__all__ = ["SharedResponse", "fit_catalog"]
+
+# arrays in the shared memory block start at multiples of this
+_ALIGN = 64
+
+# the responses attached to in a worker process, by key
+_WORKER_RESPONSES = {}
+
+
+class SharedResponse(object):
+    """
+    The arrays of an RMF or ARF, copied into one shared memory block.
+
+    The object itself only holds the name and layout of the block, so
+    it is cheap to pickle; `attach` creates the response from views of
+    the shared arrays in any process.
+    """
+
+    def __init__(self, resp):
+        """
+        Parameters
+        ----------
+        resp : RMF or ARF
+            The response to share
+
+        Attributes
+        ----------
+        name : str
+            The name of the shared memory block
+
+        layout : list of tuple
+            The name, dtype, shape and offset in the block of each array
+
+        attrs : dict
+            The scalar attributes of the response
+        """
+        if not HAS_SHARED_MEMORY:
+            raise ImportError("Sharing responses between processes requires "
+                              "multiprocessing.shared_memory (Python 3.8+).")
+
+        arrays, attrs = resp._to_arrays()
+
+        layout = []
+        size = 0
+        for key in sorted(arrays):
+            arr = np.asarray(arrays[key])
+            layout.append((key, arr.dtype.str, arr.shape, size))
+            size += -(-arr.nbytes // _ALIGN) * _ALIGN
+
+        self._shm = shared_memory.SharedMemory(create=True,
+                                               size=max(size, 1))
+        self.name = self._shm.name
+        self.layout = layout
+        self.attrs = attrs
+        self.cls = type(resp)
+
+        if isinstance(resp, RMF):
+            self.kwargs = {"backend": resp.backend,
+                           "n_threads": resp.n_threads,
+                           "compact": getattr(resp, "compact", False)}
+        else:
+            self.kwargs = {"compact": getattr(resp, "compact", False)}
+
+        for key, dtype, shape, offset in layout:
+            view = np.ndarray(shape, dtype=dtype, buffer=self._shm.buf,
+                              offset=offset)
+            view[...] = arrays[key]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_shm"] = None
+        return state
+
+    def attach(self):
+        """
+        Create the response from read-only views of the shared arrays.
+
+        Returns
+        -------
+        resp : RMF or ARF
+            The response; it keeps the shared memory block open
+        """
+        shm = self._shm
+        if shm is None:
+            shm = shared_memory.SharedMemory(name=self.name)
+
+        arrays = {}
+        for key, dtype, shape, offset in self.layout:
+            view = np.ndarray(shape, dtype=dtype, buffer=shm.buf,
+                              offset=offset)
+            view.flags.writeable = False
+            arrays[key] = view
+
+        resp = self.cls._from_arrays(arrays, self.attrs, **self.kwargs)
+        resp._shm = shm
+
+        return resp
+
+    def close(self):
+        """
+        Release the shared memory block; only call this once no process
+        uses the response any more.
+        """
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+        return
+
+
+def fit_catalog(spectra, fit, n_workers=None, chunksize=16):
+    """
+    Fit many spectra in parallel, with the responses in shared memory.
+
+    Each distinct RMF and ARF (by identity, e.g. as shared through
+    `RMF.load`) is copied into shared memory once; each worker process
+    attaches to them once and rebuilds the spectra around read-only
+    views of the shared arrays.
+
+    Parameters
+    ----------
+    spectra : iterable of XSpectrum
+        The spectra to fit
+
+    fit : callable
+        The function that fits a spectrum, called as ``fit(spectrum)``
+        in a worker process. It must be picklable (e.g. a module-level
+        function), as must its return value.
+
+    n_workers : int, default None
+        The number of worker processes; by default, the number of CPUs
+
+    chunksize : int, default 16
+        The number of spectra sent to a worker at a time
+
+    Returns
+    -------
+    results : generator of (int, object)
+        The index of each spectrum in `spectra` and the result of
+        `fit` for it, in the order in which the chunks are done
+    """
+    spectra = list(spectra)
+
+    shared = {}
+    payloads = []
+    try:
+        for spec in spectra:
+            keys = []
+            for resp in [spec.rmf, spec.arf]:
+                if resp is None:
+                    keys.append(None)
+                    continue
+                if id(resp) not in shared:
+                    shared[id(resp)] = SharedResponse(resp)
+                keys.append(id(resp))
+            payloads.append((_spectrum_state(spec), keys[0], keys[1]))
+
+        indexed = list(enumerate(payloads))
+        chunks = [indexed[i:i+chunksize]
+                  for i in range(0, len(indexed), chunksize)]
+
+        with ProcessPoolExecutor(max_workers=n_workers,
+                                 initializer=_init_worker,
+                                 initargs=(shared,)) as pool:
+            futures = [pool.submit(_fit_chunk, fit, c) for c in chunks]
+            for future in as_completed(futures):
+                for result in future.result():
+                    yield result
+    finally:
+        for s in shared.values():
+            s.close()
+
+
+def _spectrum_state(spec):
+    """
+    The attributes of `spec` without its responses and cached response,
+    which the workers rebuild.
+    """
+    state = spec.__dict__.copy()
+    state["_rmf"] = None
+    state["_arf"] = None
+    state["_resp_cache"] = None
+
+    return state
+
+
+def _init_worker(shared):
+    _WORKER_RESPONSES.clear()
+    for key, s in shared.items():
+        _WORKER_RESPONSES[key] = s.attach()
+
+
+def _fit_chunk(fit, chunk):
+    results = []
+    for i, (state, rmf_key, arf_key) in chunk:
+        spec = XSpectrum.__new__(XSpectrum)
+        spec.__dict__.update(state)
+        if rmf_key is not None:
+            spec._rmf = _WORKER_RESPONSES[rmf_key]
+        if arf_key is not None:
+            spec._arf = _WORKER_RESPONSES[arf_key]
+
+        results.append((i, fit(spec)))
+
+    return results
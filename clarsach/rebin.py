@@ -0,0 +1,59 @@
+import numpy as np
+import scipy.sparse
+
+__all__ = ["rebin_matrix"]
+
+
+def rebin_matrix(src_lo, src_hi, dst_lo, dst_hi):
+    """
+    Build the sparse operator that rebins a spectrum integrated over the
+    bins `src_lo`, `src_hi` onto the bins `dst_lo`, `dst_hi`.
+
+    Each source bin is shared among the destination bins it overlaps in
+    proportion to the overlap, i.e. the flux is assumed to be constant
+    across the source bin. The flux in the parts of source bins outside
+    the destination grid is dropped. Both grids must be sorted in
+    increasing order and their bins must not overlap.
+
+    Parameters
+    ----------
+    src_lo, src_hi : iterable
+        The edges of the bins of the spectrum
+
+    dst_lo, dst_hi : iterable
+        The edges of the bins to rebin onto
+
+    Returns
+    -------
+    rebin : scipy.sparse.csr_matrix
+        The operator of shape (n_src, n_dst); the rebinned spectrum is
+        ``rebin.T.dot(flux)``
+    """
+    src_lo = np.asarray(src_lo, dtype=np.float64)
+    src_hi = np.asarray(src_hi, dtype=np.float64)
+    dst_lo = np.asarray(dst_lo, dtype=np.float64)
+    dst_hi = np.asarray(dst_hi, dtype=np.float64)
+
+    if len(src_lo) != len(src_hi) or len(dst_lo) != len(dst_hi):
+        raise ValueError("The low and high bin edges must have the "
+                         "same length.")
+
+    # the range of destination bins each source bin overlaps
+    first = np.searchsorted(dst_hi, src_lo, side="right")
+    last = np.searchsorted(dst_lo, src_hi, side="left")
+    n_overlap = np.maximum(last - first, 0)
+
+    rows = np.repeat(np.arange(len(src_lo)), n_overlap)
+    offsets = np.arange(rows.size) - np.repeat(np.cumsum(n_overlap) -
+                                               n_overlap, n_overlap)
+    cols = np.repeat(first, n_overlap) + offsets
+
+    overlap = np.minimum(src_hi[rows], dst_hi[cols]) - \
+              np.maximum(src_lo[rows], dst_lo[cols])
+    frac = overlap / (src_hi - src_lo)[rows]
+
+    keep = frac > 0
+    rebin = scipy.sparse.coo_matrix((frac[keep], (rows[keep], cols[keep])),
+                                    shape=(len(src_lo), len(dst_lo)))
+
+    return rebin.tocsr()
@@ -0,0 +1,161 @@
+# Process-wide registry of loaded responses
+
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import scipy.sparse
+
+__all__ = ["ResponseRegistry", "registry"]
+
+# default memory budget of the registry, in bytes
+DEFAULT_MAX_BYTES = 2 * 1024**3
+
+
+def _instance_arrays(obj):
+    """
+    All arrays held by a response object, including the
+    arrays of any sparse matrices.
+    """
+    arrays = []
+    for value in vars(obj).values():
+        if isinstance(value, np.ndarray):
+            arrays.append(value)
+        elif scipy.sparse.issparse(value):
+            arrays.extend([getattr(value, name) for name in
+                           ["data", "indices", "indptr"]
+                           if hasattr(value, name)])
+    return arrays
+
+
+class ResponseRegistry(object):
+    """
+    Registry of loaded responses (e.g. `RMF` and `ARF` objects),
+    such that identical response files are parsed only once per
+    process and shared between all spectra that use them.
+
+    Instances returned by the registry are shared, so their
+    arrays are made read-only.
+
+    Parameters
+    ----------
+    max_bytes : int, default DEFAULT_MAX_BYTES
+        The memory budget of the registry. When the arrays of all
+        registered responses exceed this size, the least recently
+        used responses are dropped from the registry. Responses
+        that are still in use elsewhere are not affected.
+
+    Attributes
+    ----------
+    nbytes : int
+        The total size of all arrays of the registered responses
+    """
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+
+        self._entries = OrderedDict()
+        self._loading = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _key(self, cls, filename, kwargs):
+        filename = os.path.abspath(filename)
+        stat = os.stat(filename)
+        return (cls.__name__, filename, stat.st_size, stat.st_mtime,
+                tuple(sorted(kwargs.items())))
+
+    def get(self, cls, filename, **kwargs):
+        """
+        Return the shared instance of `cls` for `filename`, loading it
+        with `cls(filename, **kwargs)` if it is not yet registered.
+
+        Parameters
+        ----------
+        cls : class
+            The response class, e.g. `RMF` or `ARF`
+
+        filename : str
+            The file name of the response file
+
+        kwargs : dict
+            Additional keyword arguments passed to `cls`; they are part
+            of the key identifying the instance
+
+        Returns
+        -------
+        resp : cls
+            The shared, read-only instance
+        """
+        key = self._key(cls, filename, kwargs)
+
+        with self._lock:
+            resp = self._lookup(key)
+            if resp is not None:
+                return resp
+            key_lock = self._loading.setdefault(key, threading.Lock())
+
+        # parse the file holding only the lock of this key, so that
+        # threads loading different responses don't wait for each other
+        with key_lock:
+            with self._lock:
+                resp = self._lookup(key)
+            if resp is not None:
+                return resp
+
+            resp = cls(filename, **kwargs)
+
+            nbytes = 0
+            for arr in _instance_arrays(resp):
+                arr.flags.writeable = False
+                nbytes += arr.nbytes
+
+            with self._lock:
+                self._entries[key] = (resp, nbytes)
+                self.nbytes += nbytes
+                self._evict()
+                self._loading.pop(key, None)
+
+        return resp
+
+    def _lookup(self, key):
+        """
+        Return the registered instance for `key` and mark it as most
+        recently used, or None if there is none. Must be called with
+        the registry lock held.
+        """
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+
+        self._entries[key] = entry
+        return entry[0]
+
+    def _evict(self):
+        """
+        Drop the least recently used entries until the registry
+        is within its memory budget, always keeping the newest one.
+        """
+        while self.max_bytes is not None and self.nbytes > self.max_bytes \
+                and len(self._entries) > 1:
+            _, (_, nbytes) = self._entries.popitem(last=False)
+            self.nbytes -= nbytes
+
+        return
+
+    def clear(self):
+        """
+        Remove all entries from the registry.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+        return
+
+
+# the registry shared by all responses in this process
+registry = ResponseRegistry()
@@ -1,18 +1,192 @@
 # Contains functionality for responses
 
+import warnings
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    # Python 2 without the `futures` backport: fold in a single thread
+    ThreadPoolExecutor = None
+
 import numpy as np
+import scipy.sparse
 import astropy.io.fits as fits
 
-__all__ = ["RMF", "ARF"]
+from clarsach.cache import load_cache, save_cache
+from clarsach.registry import registry
+from clarsach.lowrank import LowRankResponse
+from clarsach import _kernels
+
+__all__ = ["RMF", "ARF", "BACKENDS"]
+
+# the available backends for folding a spectrum through an RMF
+BACKENDS = ["python", "numpy-sparse", "numba"]
+
+# the backend used by RMFs that don't set one explicitly; if this is
+# not available (e.g. "numba" without numba installed), "numpy-sparse"
+# is used instead
+DEFAULT_BACKEND = "numpy-sparse"
+
+# the number of energy bins read at a time by `RMF.fold_streaming`
+DEFAULT_CHUNK_ROWS = 1024
+
+# thread pools used for multi-threaded folding, keyed by size
+_THREAD_POOLS = {}
+
+# numpy data types of the FITS binary table formats that
+# may appear in variable-length array columns
+_FITS_DTYPES = {"B": ">u1", "I": ">i2", "J": ">i4", "K": ">i8",
+                "E": ">f4", "D": ">f8"}
 
 class RMF(object):
 
-    def __init__(self, filename):
+    def __init__(self, filename, cache_dir=None, backend=None, n_threads=1,
+                 compact=False, chunk_rows=None):
+        """
+        Parameters
+        ----------
+        filename : str
+            The file name with the RMF file
+
+        cache_dir : str, default None
+            If given, the parsed RMF is stored in this directory the
+            first time the file is read, and memory-mapped from there
+            on subsequent loads (see `clarsach.cache`)
+
+        backend : str, default None
+            The backend used by `apply_rmf`, one of `BACKENDS`. By
+            default, the module-level `DEFAULT_BACKEND` is used. If the
+            backend is not available, "numpy-sparse" is used instead.
+
+        n_threads : int, default 1
+            The number of threads `apply_rmf` uses to fold a spectrum
+            with the "numpy-sparse" and "numba" backends; a single thread
+            is used if `concurrent.futures` is not available
+
+        compact : bool, default False
+            If True, store the matrix elements as float32 and the channel
+            bookkeeping (`n_grp`, `f_chan`, `n_chan`) in the narrowest
+            integer types that hold them, which roughly halves the memory
+            of the RMF. Spectra are still folded in float64, so the only
+            loss of accuracy is the rounding of each matrix element to
+            float32, a relative error of at most 2**-24 (6e-8) per element
+            and so at most 6e-8 of each folded channel value, far below
+            the 1e-5 relative tolerance of the integration tests against
+            Sherpa. The "numpy-sparse" backend converts the float32
+            elements to float64 in blocks of `DEFAULT_CHUNK_ROWS` energy
+            bins during each fold, so the temporary memory is that of one
+            block; the "numba" backend needs none.
+
+        chunk_rows : int, default None
+            If given, the matrix is read and converted in blocks of this
+            many energy bins, so the memory used while loading is the
+            size of the RMF plus that of one block, rather than several
+            times the size of the RMF. This is useful for very large
+            responses. See also `fold_streaming`.
+        """
+        self.backend = backend
+        self.n_threads = n_threads
+        self.compact = compact
+
+        if cache_dir is None or not self._load_from_cache(filename,
+                                                          cache_dir):
+            self._load_rmf(filename, chunk_rows=chunk_rows)
+
+            # compact before caching, so the cache holds the compact
+            # arrays and they are memory-mapped as they are
+            if compact:
+                self._compact()
+
+            if cache_dir is not None:
+                self._save_to_cache(filename, cache_dir)
 
-        self._load_rmf(filename)
-        pass
+        if self.backend != "numba":
+            # e.g. if the cache was written by an RMF with the "numba"
+            # backend, which does not build the sparse matrix
+            self.sparse_matrix
+
+    def _compact(self):
+        """
+        Store the matrix elements as float32 and the channel bookkeeping
+        in the narrowest integer types, see `compact` in `__init__`.
+        """
+        self.n_grp = _narrow_int(self.n_grp)
+        self.f_chan = _narrow_int(self.f_chan)
+        self.n_chan = _narrow_int(self.n_chan)
+        self.matrix = np.asarray(self.matrix, dtype=np.float32)
+
+        if self._sparse_matrix is not None:
+            self._sparse_matrix = _compact_sparse(self._sparse_matrix)
+
+        return
 
-    def _load_rmf(self, filename):
+    @property
+    def sparse_matrix(self):
+        """
+        The redistribution matrix as a sparse matrix of shape (number of
+        energy bins, detchans), used to fold spectra by all backends but
+        "numba". It is built with the RMF, except for RMFs with the
+        "numba" backend, where it is only built when first used.
+        """
+        if getattr(self, "_sparse_matrix", None) is None:
+            sparse_matrix = self._build_sparse_matrix()
+            if getattr(self, "compact", False):
+                sparse_matrix = _compact_sparse(sparse_matrix)
+            self._sparse_matrix = sparse_matrix
+        return self._sparse_matrix
+
+    @sparse_matrix.setter
+    def sparse_matrix(self, sparse_matrix):
+        self._sparse_matrix = sparse_matrix
+
+    @property
+    def backend(self):
+        """
+        The backend used to fold spectra in `apply_rmf`.
+        """
+        return self._backend
+
+    @backend.setter
+    def backend(self, backend):
+        if backend is None:
+            backend = DEFAULT_BACKEND
+
+        if backend not in BACKENDS:
+            raise ValueError("Unknown backend %s; must be one of %s" %
+                             (backend, BACKENDS))
+
+        if backend == "numba" and not _kernels.HAS_NUMBA:
+            warnings.warn("numba is not installed; falling back to the "
+                          "numpy-sparse backend.")
+            backend = "numpy-sparse"
+
+        self._backend = backend
+
+    @classmethod
+    def load(cls, filename, **kwargs):
+        """
+        Load an RMF through the process-wide response registry.
+
+        Repeated calls with the same file (and keyword arguments) return
+        the same shared, read-only instance, rather than parsing the file
+        again.
+
+        Parameters
+        ----------
+        filename : str
+            The file name with the RMF file
+
+        kwargs : dict
+            Additional keyword arguments passed to `RMF`
+
+        Returns
+        -------
+        rmf : RMF
+            The shared RMF
+        """
+        return registry.get(cls, filename, **kwargs)
+
+    def _load_rmf(self, filename, chunk_rows=None):
         """
         Load an RMF from a FITS file.
 
@@ -21,6 +195,10 @@ class RMF(object):
         filename : str
             The file name with the RMF file
 
+        chunk_rows : int, default None
+            If given, read the matrix in blocks of this many energy
+            bins (see `_load_rmf_chunked`)
+
         Attributes
         ----------
         n_grp : numpy.ndarray
@@ -49,12 +227,51 @@ class RMF(object):
         detchans : int
             The number of channels in the detector
 
+        sparse_matrix : scipy.sparse.csr_matrix
+            The redistribution matrix as a sparse matrix of shape
+            (number of energy bins, detchans), built once from `n_grp`,
+            `f_chan`, `n_chan` and `matrix` and used by `apply_rmf`;
+            with the "numba" backend, it is only built when first used
+
         """
         # open the FITS file and extract the MATRIX extension
         # which contains the redistribution matrix and
         # anxillary information
         hdulist = fits.open(filename)
+        h = self._matrix_extension(hdulist)
+
+        # extract + store the attributes described in the docstring
+        n_grp = self._read_header(h)
+
+        if chunk_rows is not None:
+            self._load_rmf_chunked(filename, h, n_grp, chunk_rows)
+            hdulist.close()
+            return
+
+        # read the (possibly variable-length) columns as flat arrays
+        # together with the number of elements in each row
+        f_chan, f_chan_len = self._read_column(filename, h, "F_CHAN")
+        n_chan, n_chan_len = self._read_column(filename, h, "N_CHAN")
+        matrix, matrix_len = self._read_column(filename, h, "MATRIX")
+
+        hdulist.close()
+
+        # flatten the variable-length arrays
+        self.n_grp, self.f_chan, self.n_chan, self.matrix = \
+                self._flatten_columns(n_grp, f_chan, f_chan_len,
+                                      n_chan, n_chan_len,
+                                      matrix, matrix_len)
+
+        # build the sparse representation used for folding, unless
+        # the backend does not need it
+        self._sparse_matrix = None
+        if self.backend != "numba":
+            self.sparse_matrix = self._build_sparse_matrix()
 
+    def _matrix_extension(self, hdulist):
+        """
+        The extension of the FITS file with the redistribution matrix.
+        """
         # get all the extension names
         extnames = np.array([h.name for h in hdulist])
 
@@ -65,28 +282,188 @@ class RMF(object):
         elif "SPECRESP MATRIX" in extnames:
             h = hdulist["SPECRESP MATRIX"]
 
-        data = h.data
-        hdr = h.header
-        hdulist.close()
+        return h
 
-        # extract + store the attributes described in the docstring
-        n_grp = np.array(data.field("N_GRP"))
-        f_chan = np.array(data.field('F_CHAN'))
-        n_chan = np.array(data.field("N_CHAN"))
-        matrix = np.array(data.field("MATRIX"))
+    def _read_header(self, h):
+        """
+        Set the energy grid, number of channels and first channel from
+        the MATRIX extension `h`, and return its `N_GRP` column.
+        """
+        data = h.data
 
         self.energ_lo = np.array(data.field("ENERG_LO"))
         self.energ_hi = np.array(data.field("ENERG_HI"))
         self.energ_unit = data.columns["ENERG_LO"].unit
-        self.detchans = hdr["DETCHANS"]
+        self.detchans = h.header["DETCHANS"]
         self.offset = self.__get_tlmin(h)
 
-        # flatten the variable-length arrays
-        self.n_grp, self.f_chan, self.n_chan, self.matrix = \
-                self._flatten_arrays(n_grp, f_chan, n_chan, matrix)
+        n_grp = np.array(data.field("N_GRP"))
+        return n_grp.astype(n_grp.dtype.newbyteorder("="))
+
+    def _iter_blocks(self, filename, h, n_grp, chunk_rows):
+        """
+        Read the MATRIX extension `h` in blocks of `chunk_rows` energy
+        bins, such that only one block of the columns is in memory at
+        a time.
+
+        Yields
+        ------
+        rows : slice
+            The energy bins of the block
+
+        n_grp, f_chan, n_chan, matrix : numpy.ndarray
+            The flattened arrays of the block (see `_flatten_columns`)
+
+        block : scipy.sparse.csr_matrix
+            The rows of the redistribution matrix of the block, of
+            shape (number of energy bins in the block, detchans)
+        """
+        nrows = len(n_grp)
+        for start in range(0, nrows, chunk_rows):
+            rows = slice(start, min(start + chunk_rows, nrows))
+
+            columns = []
+            for name in ["F_CHAN", "N_CHAN", "MATRIX"]:
+                columns.extend(self._read_column(filename, h, name, rows))
+
+            flat = self._flatten_columns(n_grp[rows], *columns)
+
+            yield (rows,) + flat + (self._build_sparse_matrix(*flat),)
+
+    def _load_rmf_chunked(self, filename, h, n_grp, chunk_rows):
+        """
+        Build the flattened arrays and the sparse matrix block by block,
+        see `_iter_blocks`. The output arrays are allocated once, so the
+        peak memory is their size plus the working set of one block.
+        """
+        # the number of matrix elements and groups in use, from the
+        # per-row lengths (the heap descriptors for variable-length
+        # columns), without reading the columns themselves
+        matrix_len = self._column_lengths(h, "MATRIX")
+        nelem = np.sum(matrix_len[n_grp > 0])
+
+        # the sparse matrix is only assembled if the backend uses it
+        build_sparse = self.backend != "numba"
+
+        # allocate the matrix elements in their final precision
+        dtype = np.float32 if self.compact else None
+
+        matrix = None
+        f_chan = []
+        n_chan = []
+        if build_sparse:
+            sparse_data = np.empty(nelem, dtype=dtype or np.float64)
+            sparse_indices = np.empty(nelem, dtype=np.int32 if
+                                      self.detchans < 2**31 else np.int64)
+            sparse_indptr = np.zeros(len(n_grp) + 1, dtype=np.int64)
+
+        pos = 0
+        nnz = 0
+        for rows, _, fc, nc, mx, block in self._iter_blocks(filename, h,
+                                                            n_grp,
+                                                            chunk_rows):
+            if matrix is None:
+                matrix = np.empty(nelem, dtype=dtype or mx.dtype)
+            matrix[pos:pos + len(mx)] = mx
+            pos += len(mx)
+
+            f_chan.append(fc)
+            n_chan.append(nc)
+
+            if not build_sparse:
+                continue
+
+            sparse_data[nnz:nnz + block.nnz] = block.data
+            sparse_indices[nnz:nnz + block.nnz] = block.indices
+            sparse_indptr[rows.start + 1:rows.stop + 1] = \
+                    nnz + block.indptr[1:]
+            nnz += block.nnz
+
+        if matrix is None:
+            matrix = np.empty(0)
+
+        self.n_grp = n_grp
+        self.f_chan = np.concatenate(f_chan) if f_chan else np.array([])
+        self.n_chan = np.concatenate(n_chan) if n_chan else np.array([])
+        self.matrix = matrix[:pos]
+
+        self._sparse_matrix = None
+        if not build_sparse:
+            return
+
+        if sparse_indptr[-1] <= np.iinfo(np.int32).max:
+            sparse_indptr = sparse_indptr.astype(np.int32)
+
+        self.sparse_matrix = scipy.sparse.csr_matrix(
+            (sparse_data[:nnz], sparse_indices[:nnz], sparse_indptr),
+            shape=(len(n_grp), self.detchans), copy=False)
 
         return
 
+    def _column_lengths(self, h, name):
+        """
+        The number of elements in each row of a column of the MATRIX
+        extension `h`, without reading the column.
+        """
+        nrows = h.header["NAXIS2"]
+        tform = h.columns[name].format
+        if tform.lstrip("0123456789")[:1] in ["P", "Q"]:
+            return h.data.view(np.ndarray)[name][:, 0].astype(np.int64)
+
+        shape = h.data.view(np.ndarray)[name].shape
+        return np.zeros(nrows, dtype=np.int64) + int(np.prod(shape[1:]))
+
+    @classmethod
+    def fold_streaming(cls, filename, spec, chunk_rows=DEFAULT_CHUNK_ROWS):
+        """
+        Fold a spectrum through the RMF in a file, reading the matrix in
+        blocks of energy bins without ever keeping all of it in memory.
+
+        This is meant for responses too large to load; it reads the file
+        on every call, so for repeated folds, load the RMF instead
+        (possibly with `chunk_rows`, which bounds the memory used while
+        loading).
+
+        Parameters
+        ----------
+        filename : str
+            The file name with the RMF file
+
+        spec : numpy.ndarray
+            The (model) spectrum to be folded, of shape (n_energy,) or
+            (n_models, n_energy)
+
+        chunk_rows : int, default 1024
+            The number of energy bins read at a time
+
+        Returns
+        -------
+        counts : numpy.ndarray
+            The (model) spectrum after folding, of shape (detchans,) or
+            (n_models, detchans)
+        """
+        rmf = cls.__new__(cls)
+
+        spec = np.asarray(spec, dtype=np.float64)
+
+        hdulist = fits.open(filename)
+        try:
+            h = rmf._matrix_extension(hdulist)
+            n_grp = rmf._read_header(h)
+
+            if spec.shape[-1] != len(n_grp):
+                raise ValueError("The spectrum has %i energy bins, but the "
+                                 "RMF has %i." % (spec.shape[-1], len(n_grp)))
+
+            counts = np.zeros(spec.shape[:-1] + (rmf.detchans,))
+            for block in rmf._iter_blocks(filename, h, n_grp, chunk_rows):
+                rows, sparse_block = block[0], block[-1]
+                counts += sparse_block.T.dot(spec[..., rows].T).T
+        finally:
+            hdulist.close()
+
+        return counts
+
     def __get_tlmin(self, h):
         """
         Get the tlmin keyword for `F_CHAN`.
@@ -117,41 +494,294 @@ class RMF(object):
 
         return tlmin
 
+    def _load_from_cache(self, filename, cache_dir):
+        """
+        Load the RMF from the on-disk cache, if it exists.
+
+        Returns
+        -------
+        success : bool
+            True if the RMF was found in the cache
+        """
+        arrays, attrs = load_cache(filename, cache_dir,
+                                   _cache_variant(self.compact))
+        if arrays is None:
+            return False
+
+        self._set_arrays(arrays, attrs)
+
+        return True
+
+    def _save_to_cache(self, filename, cache_dir):
+        """
+        Store the parsed RMF in the on-disk cache.
+        """
+        arrays, attrs = self._to_arrays()
+        save_cache(filename, cache_dir, arrays, attrs,
+                   _cache_variant(self.compact))
+
+        return
+
+    def _to_arrays(self):
+        """
+        The parsed RMF as a dictionary of arrays and a dictionary of
+        scalar attributes, e.g. to store it in the on-disk cache or in
+        shared memory (see `clarsach.parallel`).
+        """
+        arrays = {"energ_lo": self.energ_lo, "energ_hi": self.energ_hi,
+                  "n_grp": self.n_grp, "f_chan": self.f_chan,
+                  "n_chan": self.n_chan, "matrix": self.matrix}
+
+        # the sparse matrix, if it has been built
+        if self._sparse_matrix is not None:
+            arrays["sparse_data"] = self._sparse_matrix.data
+            arrays["sparse_indices"] = self._sparse_matrix.indices
+            arrays["sparse_indptr"] = self._sparse_matrix.indptr
+
+        attrs = {"energ_unit": self.energ_unit,
+                 "detchans": int(self.detchans),
+                 "offset": int(self.offset)}
+
+        return arrays, attrs
+
+    def _set_arrays(self, arrays, attrs):
+        """
+        Set the parsed RMF from the dictionaries of arrays and scalar
+        attributes returned by `_to_arrays`. The arrays are used as
+        they are, without copying them.
+        """
+        for name in ["energ_lo", "energ_hi", "n_grp", "f_chan", "n_chan",
+                     "matrix"]:
+            setattr(self, name, arrays[name])
+
+        self.energ_unit = attrs["energ_unit"]
+        self.detchans = attrs["detchans"]
+        self.offset = attrs["offset"]
+
+        self._sparse_matrix = None
+        if "sparse_data" in arrays:
+            self.sparse_matrix = scipy.sparse.csr_matrix(
+                (arrays["sparse_data"], arrays["sparse_indices"],
+                 arrays["sparse_indptr"]),
+                shape=(len(self.n_grp), self.detchans), copy=False)
+
+        return
+
+    @classmethod
+    def _from_arrays(cls, arrays, attrs, backend=None, n_threads=1,
+                     compact=False):
+        """
+        Create an RMF from the dictionaries returned by `_to_arrays`,
+        without reading a file.
+        """
+        rmf = cls.__new__(cls)
+        rmf.backend = backend
+        rmf.n_threads = n_threads
+        rmf.compact = compact
+        rmf._set_arrays(arrays, attrs)
+
+        return rmf
+
+    def _read_column(self, filename, h, name, rows=slice(None)):
+        """
+        Read a column of the MATRIX extension as a flat array.
+
+        Variable-length array columns are read straight from the heap
+        of the FITS file, using the (count, offset) descriptors stored
+        in the table, such that no Python-level iteration over rows is
+        necessary. Fixed-width columns are simply flattened.
+
+        Parameters
+        ----------
+        filename : str
+            The file name with the RMF file
+
+        h : an astropy.io.fits.hdu.table.BinTableHDU object
+            The extension containing the column
+
+        name : str
+            The name of the column
+
+        rows : slice, default slice(None)
+            The rows to read; only the part of the file with these
+            rows is accessed
+
+        Returns
+        -------
+        values : numpy.ndarray
+            All elements of the column, concatenated row by row
+
+        row_len : numpy.ndarray
+            The number of elements in each row
+        """
+        nrows = len(range(*rows.indices(h.header["NAXIS2"])))
+        tform = h.columns[name].format
+        heap = None
+        if tform.lstrip("0123456789")[:1] in ["P", "Q"]:
+            heap = self.__get_heap(filename, h)
+
+        if heap is None:
+            # fixed-width column, or a heap we can't access directly
+            values = h.data[rows].field(name)
+            if values.dtype == object:
+                row_len = np.array([np.size(v) for v in values], dtype=np.int64)
+                values = np.hstack(values) if np.sum(row_len) > 0 else \
+                         np.array([])
+            elif values.ndim == 1:
+                row_len = np.ones(nrows, dtype=np.int64)
+            else:
+                row_len = np.zeros(nrows, dtype=np.int64) + values.shape[1]
+            values = np.asarray(values).ravel()
+            return values.astype(values.dtype.newbyteorder("=")), row_len
+
+        # the element data type is the letter after the P/Q
+        letter = tform.lstrip("0123456789")[1]
+        dtype = np.dtype(_FITS_DTYPES[letter])
+
+        # the descriptors are the raw (count, byte offset) pairs
+        desc = h.data.view(np.ndarray)[name][rows]
+        row_len = desc[:, 0].astype(np.int64)
+        row_offset = desc[:, 1].astype(np.int64)
+
+        # byte offset of each element into the heap
+        nelem = np.sum(row_len)
+        row_start = np.cumsum(row_len) - row_len
+        elem_offset = np.repeat(row_offset - row_start * dtype.itemsize,
+                                row_len) + \
+                      np.arange(nelem, dtype=np.int64) * dtype.itemsize
+
+        if np.all(row_offset % dtype.itemsize == 0):
+            # the heap can be viewed directly as the element type
+            nheap = len(heap) // dtype.itemsize
+            values = heap[:nheap * dtype.itemsize].view(dtype)
+            values = values[elem_offset // dtype.itemsize]
+        else:
+            byte_idx = elem_offset[:, None] + np.arange(dtype.itemsize)
+            values = heap[byte_idx].ravel().view(dtype)
+
+        return values.astype(dtype.newbyteorder("=")), row_len
+
+    def __get_heap(self, filename, h):
+        """
+        Memory-map the heap of a binary table extension.
+
+        Parameters
+        ----------
+        filename : str
+            The file name with the RMF file
+
+        h : an astropy.io.fits.hdu.table.BinTableHDU object
+            The extension with the heap
+
+        Returns
+        -------
+        heap : numpy.ndarray or None
+            The heap as an array of bytes, or None if the file cannot
+            be mapped directly (e.g. because it is compressed)
+        """
+        hdr = h.header
+        info = h.fileinfo()
+        # only map files given by name (str or, on Python 2, unicode),
+        # not file objects
+        if info is None or hasattr(filename, "read"):
+            return None
+
+        theap = hdr.get("THEAP", hdr["NAXIS1"] * hdr["NAXIS2"])
+        pcount = hdr["PCOUNT"]
+
+        try:
+            raw = np.memmap(filename, dtype=np.uint8, mode="r")
+        except (IOError, ValueError):
+            return None
+
+        # make sure the file on disk is the uncompressed FITS file
+        hdr_loc = info["hdrLoc"]
+        if raw[hdr_loc:hdr_loc + 8].tobytes() != b"XTENSION":
+            return None
+
+        start = info["datLoc"] + theap
+        return raw[start:start + pcount]
+
     def _flatten_arrays(self, n_grp, f_chan, n_chan, matrix):
+        """
+        Flatten the per-row arrays of an RMF.
 
+        Parameters
+        ----------
+        n_grp : numpy.ndarray
+            The number of channel groups for each energy bin
+
+        f_chan, n_chan, matrix : numpy.ndarray
+            The `F_CHAN`, `N_CHAN` and `MATRIX` columns with one
+            entry (a number or an array) per energy bin
+
+        Returns
+        -------
+        n_grp, f_chan, n_chan, matrix : numpy.ndarray
+            The flattened arrays, see `_flatten_columns`
+        """
         if not len(n_grp) == len(f_chan) == len(n_chan) == len(matrix):
             raise ValueError("Arrays must be of same length!")
 
+        columns = []
+        for c in [f_chan, n_chan, matrix]:
+            c = np.asarray(c)
+            if c.dtype == object:
+                row_len = np.array([np.size(v) for v in c], dtype=np.int64)
+                c = np.hstack(c)
+            elif c.ndim == 1:
+                row_len = np.ones(len(c), dtype=np.int64)
+            else:
+                row_len = np.zeros(len(c), dtype=np.int64) + c.shape[1]
+            columns.extend([np.ravel(c), row_len])
+
+        return self._flatten_columns(n_grp, *columns)
+
+    def _flatten_columns(self, n_grp, f_chan, f_chan_len, n_chan, n_chan_len,
+                         matrix, matrix_len):
+        """
+        Select the channel groups and matrix elements that are in use.
+
+        Parameters
+        ----------
+        n_grp : numpy.ndarray
+            The number of channel groups for each energy bin
+
+        f_chan, n_chan, matrix : numpy.ndarray
+            The `F_CHAN`, `N_CHAN` and `MATRIX` columns, with all
+            rows concatenated
+
+        f_chan_len, n_chan_len, matrix_len : numpy.ndarray
+            The number of elements in each row of `f_chan`,
+            `n_chan` and `matrix`
+
+        Returns
+        -------
+        n_grp : numpy.ndarray
+            The number of channel groups for each energy bin
+
+        f_chan, n_chan : numpy.ndarray
+            The first channel and number of channels of each group
+            in use, flattened
+
+        matrix : numpy.ndarray
+            The elements of the matrix for all energy bins with at
+            least one channel group, flattened
+        """
+        n_grp = np.asarray(n_grp)
+
         # find all non-zero groups
         nz_idx = (n_grp > 0)
 
         # stack all non-zero rows in the matrix
-        matrix_flat = np.hstack(matrix[nz_idx])
-
-        # stack all nonzero rows in n_chan and f_chan
-        #n_chan_flat = np.hstack(n_chan[nz_idx])
-        #f_chan_flat = np.hstack(f_chan[nz_idx])
+        matrix_flat = matrix[np.repeat(nz_idx, matrix_len)]
 
         # some matrices actually have more elements
         # than groups in `n_grp`, so we'll only pick out
         # those values that have a correspondence in
         # n_grp
-        f_chan_new = []
-        n_chan_new = []
-        for i,t in enumerate(nz_idx):
-            if t:
-                n = n_grp[i]
-                f = f_chan[i]
-                nc = n_chan[i]
-                if np.size(f) == 1:
-                    f_chan_new.append(f)
-                    n_chan_new.append(nc)
-                else:
-                    f_chan_new.append(f[:n])
-                    n_chan_new.append(nc[:n])
-
-        n_chan_flat = np.hstack(n_chan_new)
-        f_chan_flat = np.hstack(f_chan_new)
+        f_chan_flat = f_chan[self.__group_mask(n_grp, f_chan_len)]
+        n_chan_flat = n_chan[self.__group_mask(n_grp, n_chan_len)]
 
         # if n_chan is zero, we'll remove those as well.
         nz_idx2 = (n_chan_flat > 0)
@@ -160,7 +790,316 @@ class RMF(object):
 
         return n_grp, f_chan_flat, n_chan_flat, matrix_flat
 
-    def apply_rmf(self, spec):
+    def __group_mask(self, n_grp, row_len):
+        """
+        Mask the first `n_grp[i]` elements in each row i of a flattened
+        column with `row_len[i]` elements in row i.
+        """
+        row_start = np.cumsum(row_len) - row_len
+        pos = np.arange(np.sum(row_len)) - np.repeat(row_start, row_len)
+        return pos < np.repeat(n_grp, row_len)
+
+    def _group_indices(self, n_grp=None, f_chan=None, n_chan=None):
+        """
+        Unpack the bookkeeping in `n_grp`, `f_chan` and `n_chan`
+        (see `_apply_rmf_loop`) into explicit indices for every
+        channel group.
+
+        Parameters
+        ----------
+        n_grp, f_chan, n_chan : numpy.ndarray, default None
+            The flattened bookkeeping of a block of energy bins (see
+            `_flatten_columns`); by default, that of the whole RMF
+
+        Returns
+        -------
+        grp_energy : numpy.ndarray
+            The energy bin of each channel group
+
+        grp_chan : numpy.ndarray
+            The first (zero-based) output channel of each group
+
+        grp_start : numpy.ndarray
+            The index into `matrix` of the first element of each group
+        """
+        if n_grp is None:
+            n_grp, f_chan, n_chan = self.n_grp, self.f_chan, self.n_chan
+        n_chan = np.asarray(n_chan, dtype=np.int64)
+
+        grp_energy = np.repeat(np.arange(len(n_grp)), n_grp)
+        grp_chan = np.asarray(f_chan, dtype=np.int64) - self.offset
+        grp_start = np.cumsum(n_chan) - n_chan
+
+        return grp_energy, grp_chan, grp_start
+
+    def _build_sparse_matrix(self, n_grp=None, f_chan=None, n_chan=None,
+                             matrix=None):
+        """
+        Build a sparse representation of the redistribution matrix.
+
+        This assigns explicit (energy bin, channel) indices to every
+        element in the flattened `matrix`, so that folding a spectrum
+        becomes a single sparse matrix-vector product.
+
+        Parameters
+        ----------
+        n_grp, f_chan, n_chan, matrix : numpy.ndarray, default None
+            The flattened arrays of a block of energy bins (see
+            `_flatten_columns`); by default, those of the whole RMF
+
+        Returns
+        -------
+        sparse_matrix : scipy.sparse.csr_matrix
+            The redistribution matrix of shape (number of energy bins,
+            detchans)
+        """
+        if n_grp is None:
+            n_grp, f_chan, n_chan, matrix = self.n_grp, self.f_chan, \
+                                            self.n_chan, self.matrix
+
+        n_energy = len(n_grp)
+        grp_energy, grp_chan, grp_start = self._group_indices(n_grp, f_chan,
+                                                              n_chan)
+        n_chan = np.asarray(n_chan, dtype=np.int64)
+
+        # the energy bin and channel of each element in the flattened matrix
+        nelem = np.sum(n_chan)
+        elem_energy = np.repeat(grp_energy, n_chan)
+        elem_chan = np.repeat(grp_chan - grp_start, n_chan) + np.arange(nelem)
+
+        # channels beyond `detchans` are dropped when folding
+        valid = (elem_chan >= 0) & (elem_chan < self.detchans)
+
+        data = np.asarray(matrix[:nelem], dtype=np.float64)
+
+        # duplicate entries are summed, like the accumulation in the loop
+        sparse_matrix = scipy.sparse.coo_matrix((data[valid],
+                                                 (elem_energy[valid],
+                                                  elem_chan[valid])),
+                                                shape=(n_energy,
+                                                       self.detchans))
+
+        return sparse_matrix.tocsr()
+
+    def apply_rmf(self, spec, n_threads=None):
+        """
+        Fold the spectrum through the redistribution matrix.
+
+        How the spectrum is folded depends on `backend`:
+            * "numpy-sparse" uses the sparse representation of the
+              redistribution matrix in `sparse_matrix`, built once
+              when the RMF is loaded
+            * "numba" runs a compiled kernel over the channel groups
+              in `n_grp`, `f_chan` and `n_chan` directly
+            * "python" uses the explicit loop in `_apply_rmf_loop`
+        All backends give the same result.
+
+        Many spectra can be folded at once by passing a 2D array with
+        one spectrum per row; with the "numpy-sparse" backend, this is
+        done as a single sparse matrix-matrix product.
+
+        With more than one thread, the "numpy-sparse" backend splits the
+        output channels into blocks with a similar number of matrix
+        elements, one per thread, while the "numba" backend splits the
+        channel groups between threads and sums the partial results in
+        a fixed order. In both cases, the result does not depend on the
+        scheduling of the threads.
+
+        Parameters
+        ----------
+        spec : numpy.ndarray
+            The (model) spectrum to be folded, of shape (n_energy,) or
+            (n_models, n_energy)
+
+        n_threads : int, default None
+            The number of threads to use; by default, the `n_threads`
+            attribute set when creating the RMF is used
+
+        Returns
+        -------
+        counts : numpy.ndarray
+            The (model) spectrum after folding, in
+            counts/s/channel, of shape (detchans,) or
+            (n_models, detchans)
+
+        """
+        spec = np.asarray(spec, dtype=np.float64)
+        n_threads = self._n_threads(n_threads)
+
+        if self.backend == "numba":
+            return self._apply_rmf_numba(spec, n_threads)
+
+        elif self.backend == "python":
+            if spec.ndim == 1:
+                return self._apply_rmf_loop(spec)
+            return np.array([self._apply_rmf_loop(s) for s in spec])
+
+        if n_threads > 1:
+            return self._apply_rmf_threaded(spec, n_threads)
+
+        if self.sparse_matrix.dtype != np.float64:
+            return _fold_float64(self.sparse_matrix, spec)
+
+        return self.sparse_matrix.T.dot(spec.T).T
+
+    def _n_threads(self, n_threads):
+        """
+        The number of threads to fold with: `n_threads`, or by default the
+        `n_threads` attribute, or 1 if threads are not available.
+        """
+        if n_threads is None:
+            n_threads = self.n_threads
+        if ThreadPoolExecutor is None:
+            n_threads = 1
+        return n_threads
+
+    def _apply_rmf_threaded(self, spec, n_threads, transpose=False):
+        """
+        Fold the spectrum with the sparse matrix, split into blocks of
+        output channels (or energy bins, for the transpose) that are
+        folded in parallel.
+        """
+        blocks = self._row_blocks(n_threads, transpose=transpose)
+        pool = _thread_pool(n_threads)
+
+        out = list(pool.map(lambda b: b.dot(spec.T), blocks))
+
+        return np.concatenate(out, axis=0).T
+
+    def _row_blocks(self, n_blocks, transpose=False):
+        """
+        Split the (channel x energy) redistribution matrix, or the
+        (energy x channel) matrix if `transpose` is True, into
+        `n_blocks` blocks of consecutive rows with a similar number
+        of non-zero elements each.
+
+        Returns
+        -------
+        blocks : list of scipy.sparse.csr_matrix
+            The blocks, in order of row
+        """
+        if not hasattr(self, "_blocks"):
+            self._blocks = {}
+
+        key = (n_blocks, transpose)
+        if key not in self._blocks:
+            if transpose:
+                matrix = self.sparse_matrix
+            else:
+                matrix = self.sparse_matrix.T.tocsr()
+            self._blocks[key] = _split_rows(matrix, n_blocks)
+
+        return self._blocks[key]
+
+    def _apply_rmf_numba(self, spec, n_threads=1, transpose=False):
+        """
+        Fold the spectrum with the compiled kernels in
+        `clarsach._kernels`: `fold_groups`, or `unfold_groups` for
+        the transpose.
+        """
+        if not hasattr(self, "_groups"):
+            self._groups = self._group_indices()
+        grp_energy, grp_chan, grp_start = self._groups
+        n_chan = np.asarray(self.n_chan, dtype=np.int64)
+
+        spec2d = np.atleast_2d(spec)
+        if transpose:
+            kernel = _kernels.unfold_groups
+            shape = (spec2d.shape[0], len(self.n_grp))
+        else:
+            kernel = _kernels.fold_groups
+            shape = (spec2d.shape[0], self.detchans)
+
+        def fold(g):
+            out = np.zeros(shape)
+            kernel(spec2d, grp_energy[g], grp_chan[g], n_chan[g],
+                   grp_start[g], self.matrix, out)
+            return out
+
+        if n_threads > 1:
+            # split the channel groups between threads, and add up
+            # the partial results in order
+            bounds = np.linspace(0, len(grp_energy), n_threads + 1)
+            bounds = bounds.astype(np.int64)
+            partial = _thread_pool(n_threads).map(
+                fold, [slice(g0, g1) for g0, g1 in zip(bounds[:-1],
+                                                       bounds[1:])])
+            out = np.zeros(shape)
+            for c in partial:
+                out += c
+        else:
+            out = fold(slice(None))
+
+        if spec.ndim == 1:
+            return out[0]
+        return out
+
+    def apply_rmf_transpose(self, counts, n_threads=None):
+        """
+        Apply the transpose of the redistribution matrix to a vector
+        in channel space, e.g. to propagate the gradient of a fit
+        statistic with respect to the folded model back to the
+        gradient with respect to the model spectrum.
+
+        This costs the same as folding a spectrum with `apply_rmf`.
+        The "numba" backend uses a compiled kernel over the channel
+        groups; the other backends use `sparse_matrix`.
+
+        Parameters
+        ----------
+        counts : numpy.ndarray
+            The channel-space vector, of shape (detchans,) or
+            (n_models, detchans)
+
+        n_threads : int, default None
+            The number of threads to use; by default, the `n_threads`
+            attribute set when creating the RMF is used
+
+        Returns
+        -------
+        spec : numpy.ndarray
+            The result in energy space, of shape (n_energy,) or
+            (n_models, n_energy)
+        """
+        counts = np.asarray(counts, dtype=np.float64)
+        n_threads = self._n_threads(n_threads)
+
+        if self.backend == "numba":
+            return self._apply_rmf_numba(counts, n_threads, transpose=True)
+
+        if n_threads > 1:
+            return self._apply_rmf_threaded(counts, n_threads,
+                                            transpose=True)
+
+        if self.sparse_matrix.dtype != np.float64:
+            return _fold_float64(self.sparse_matrix, counts, transpose=True)
+
+        return self.sparse_matrix.dot(counts.T).T
+
+    def low_rank(self, tol=1e-3, max_rank=None):
+        """
+        Build a low-rank approximation of the redistribution matrix, for
+        fast approximate folding (see `clarsach.lowrank`).
+
+        Parameters
+        ----------
+        tol : float, default 1e-3
+            The largest discarded singular value, relative to the
+            largest singular value
+
+        max_rank : int, default None
+            If given, the largest rank of the approximation
+
+        Returns
+        -------
+        resp : LowRankResponse
+            The approximation; fold spectra with its `apply` method,
+            and see its `max_residual` for the achieved accuracy
+        """
+        return LowRankResponse(self.sparse_matrix, tol=tol,
+                               max_rank=max_rank)
+
+    def _apply_rmf_loop(self, spec):
         """
         Fold the spectrum through the redistribution matrix.
 
@@ -245,7 +1184,7 @@ class RMF(object):
                     counts[counts_idx:counts_idx +
                                       current_num_chans] += self.matrix[resp_idx:resp_idx +
                                                                                  current_num_chans] * \
-                                                                np.float(source_bin_i)
+                                                                float(source_bin_i)
                     # iterate the response index for next round
                     resp_idx += current_num_chans
 
@@ -253,12 +1192,169 @@ class RMF(object):
         return counts[:self.detchans]
 
 
+def _split_rows(matrix, n_blocks):
+    """
+    Split a CSR matrix into `n_blocks` blocks of consecutive rows
+    with a similar number of non-zero elements each. The blocks
+    share the data of `matrix`.
+    """
+    indptr = matrix.indptr
+
+    # block boundaries at equal fractions of the non-zero elements
+    bounds = np.searchsorted(indptr, np.linspace(0, indptr[-1],
+                                                 n_blocks + 1))
+    bounds[0], bounds[-1] = 0, matrix.shape[0]
+
+    blocks = []
+    for r0, r1 in zip(bounds[:-1], bounds[1:]):
+        i0, i1 = indptr[r0], indptr[r1]
+        blocks.append(scipy.sparse.csr_matrix(
+            (matrix.data[i0:i1], matrix.indices[i0:i1],
+             indptr[r0:r1 + 1] - i0),
+            shape=(r1 - r0, matrix.shape[1])))
+
+    return blocks
+
+
+def _narrow_int(values, min_dtype=np.int8):
+    """
+    Convert `values` to the narrowest signed integer type, but no
+    narrower than `min_dtype`, that holds all of them.
+    """
+    values = np.asarray(values)
+    lo = values.min() if values.size else 0
+    hi = values.max() if values.size else 0
+
+    for dtype in [np.int8, np.int16, np.int32, np.int64]:
+        if np.dtype(dtype).itemsize < np.dtype(min_dtype).itemsize:
+            continue
+        info = np.iinfo(dtype)
+        if info.min <= lo and hi <= info.max:
+            return values.astype(dtype, copy=False)
+
+    return values
+
+
+def _fold_float64(sparse_matrix, spec, transpose=False):
+    """
+    Fold `spec` with a sparse matrix of lower precision (e.g. of a compact
+    RMF) in float64, converting `DEFAULT_CHUNK_ROWS` energy bins of the
+    matrix at a time rather than all of it at once.
+
+    Parameters
+    ----------
+    sparse_matrix : scipy.sparse.csr_matrix
+        The matrix of shape (n_energy, detchans)
+
+    spec : numpy.ndarray
+        The spectra to fold, of shape (..., n_energy), or for the
+        transpose, the channel-space vectors of shape (..., detchans)
+
+    transpose : bool, default False
+        If True, apply the transpose of the fold
+
+    Returns
+    -------
+    out : numpy.ndarray
+        The result, of shape (..., detchans), or (..., n_energy)
+        for the transpose
+    """
+    n_energy, detchans = sparse_matrix.shape
+    out = np.zeros(spec.shape[:-1] + ((n_energy,) if transpose
+                                      else (detchans,)))
+
+    for start in range(0, n_energy, DEFAULT_CHUNK_ROWS):
+        rows = slice(start, min(start + DEFAULT_CHUNK_ROWS, n_energy))
+        block = sparse_matrix[rows].astype(np.float64)
+        if transpose:
+            out[..., rows] = block.dot(spec.T).T
+        else:
+            out += block.T.dot(spec[..., rows].T).T
+
+    return out
+
+
+def _cache_variant(compact):
+    """
+    The variant of a response in the on-disk cache, see `clarsach.cache`.
+    """
+    return "compact" if compact else None
+
+
+def _compact_sparse(sparse_matrix):
+    """
+    The sparse matrix with float32 elements and the narrowest
+    index types, see `compact` in `RMF`.
+    """
+    return scipy.sparse.csr_matrix(
+        (np.asarray(sparse_matrix.data, dtype=np.float32),
+         _narrow_int(sparse_matrix.indices, np.int32),
+         _narrow_int(sparse_matrix.indptr, np.int32)),
+        shape=sparse_matrix.shape, copy=False)
+
+
+def _thread_pool(n_threads):
+    """
+    Return a shared pool of `n_threads` threads.
+    """
+    if n_threads not in _THREAD_POOLS:
+        _THREAD_POOLS[n_threads] = ThreadPoolExecutor(max_workers=n_threads)
+    return _THREAD_POOLS[n_threads]
+
+
 class ARF(object):
 
-    def __init__(self, filename):
+    def __init__(self, filename, cache_dir=None, compact=False):
+        """
+        Parameters
+        ----------
+        filename : str
+            The file name with the ARF file
+
+        cache_dir : str, default None
+            If given, the parsed ARF is stored in this directory the
+            first time the file is read, and memory-mapped from there
+            on subsequent loads (see `clarsach.cache`)
+
+        compact : bool, default False
+            If True, store the effective area as float32; spectra are
+            still multiplied in float64 (see `compact` in `RMF`)
+        """
+        self.compact = compact
+
+        if cache_dir is None or not self._load_from_cache(filename,
+                                                          cache_dir):
+            self._load_arf(filename)
+
+            if compact:
+                self.specresp = np.asarray(self.specresp, dtype=np.float32)
+
+            if cache_dir is not None:
+                self._save_to_cache(filename, cache_dir)
+
+    @classmethod
+    def load(cls, filename, **kwargs):
+        """
+        Load an ARF through the process-wide response registry.
+
+        Repeated calls with the same file (and keyword arguments) return
+        the same shared, read-only instance, rather than parsing the file
+        again.
 
-        self._load_arf(filename)
-        pass
+        Parameters
+        ----------
+        filename : str
+            The file name with the ARF file
+
+        kwargs : dict
+            Additional keyword arguments passed to `ARF`
+
+        Returns
+        -------
+        arf : ARF
+            The shared ARF
+        """
+        return registry.get(cls, filename, **kwargs)
 
     def _load_arf(self, filename):
         """
@@ -301,6 +1397,79 @@ class ARF(object):
 
         return
 
+    def _load_from_cache(self, filename, cache_dir):
+        """
+        Load the ARF from the on-disk cache, if it exists.
+
+        Returns
+        -------
+        success : bool
+            True if the ARF was found in the cache
+        """
+        arrays, attrs = load_cache(filename, cache_dir,
+                                   _cache_variant(self.compact))
+        if arrays is None:
+            return False
+
+        self._set_arrays(arrays, attrs)
+
+        return True
+
+    def _save_to_cache(self, filename, cache_dir):
+        """
+        Store the parsed ARF in the on-disk cache.
+        """
+        arrays, attrs = self._to_arrays()
+        save_cache(filename, cache_dir, arrays, attrs,
+                   _cache_variant(self.compact))
+
+        return
+
+    def _to_arrays(self):
+        """
+        The parsed ARF as a dictionary of arrays and a dictionary of
+        scalar attributes, see `RMF._to_arrays`.
+        """
+        arrays = {"e_low": self.e_low, "e_high": self.e_high,
+                  "specresp": self.specresp}
+        attrs = {"e_unit": self.e_unit, "exposure": float(self.exposure)}
+
+        if np.ndim(self.fracexpo) > 0:
+            arrays["fracexpo"] = np.array(self.fracexpo)
+        else:
+            attrs["fracexpo"] = float(self.fracexpo)
+
+        return arrays, attrs
+
+    def _set_arrays(self, arrays, attrs):
+        """
+        Set the parsed ARF from the dictionaries returned by `_to_arrays`.
+        """
+        self.e_low = arrays["e_low"]
+        self.e_high = arrays["e_high"]
+        self.specresp = arrays["specresp"]
+        self.e_unit = attrs["e_unit"]
+        self.exposure = attrs["exposure"]
+
+        if "fracexpo" in arrays:
+            self.fracexpo = arrays["fracexpo"]
+        else:
+            self.fracexpo = attrs["fracexpo"]
+
+        return
+
+    @classmethod
+    def _from_arrays(cls, arrays, attrs, compact=False):
+        """
+        Create an ARF from the dictionaries returned by `_to_arrays`,
+        without reading a file.
+        """
+        arf = cls.__new__(cls)
+        arf.compact = compact
+        arf._set_arrays(arrays, attrs)
+
+        return arf
+
     def apply_arf(self, spec, exposure=None):
         """
         Fold the spectrum through the ARF.
@@ -312,7 +1481,8 @@ class ARF(object):
         Parameters
         ----------
         spec : numpy.ndarray
-            The (model) spectrum to be folded
+            The (model) spectrum to be folded, of shape (n_energy,) or
+            (n_models, n_energy) to fold many spectra at once
 
         exposure : float, default None
             Value for the exposure time. By default, `apply_arf` will use the
@@ -326,13 +1496,13 @@ class ARF(object):
         -------
         s_arf : numpy.ndarray
             The (model) spectrum after folding, in
-            counts/s/channel
+            counts/s/channel, of the same shape as `spec`
 
         """
-        assert spec.shape[0] == self.specresp.shape[0], "The input spectrum must " \
+        spec = np.asarray(spec)
+        assert spec.shape[-1] == self.specresp.shape[0], "The input spectrum must " \
                                                       "be of same size as the " \
                                                       "ARF array."
         if exposure is None:
-            return np.array(spec) * self.specresp * self.exposure
-        else:
-            return np.array(spec) * self.specresp * exposure
+            exposure = self.exposure
+        return np.array(spec, dtype=np.float64) * self.specresp * exposure
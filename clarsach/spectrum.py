@@ -1,10 +1,17 @@
 import numpy as np
+import scipy.sparse
 import os
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict
 
 from clarsach.respond import RMF, ARF
+from clarsach.rebin import rebin_matrix
+from clarsach.lowrank import LowRankResponse
 from astropy.io import fits
 
-__all__ = ['XSpectrum']
+__all__ = ['XSpectrum', 'PHAII']
 
 ALLOWED_UNITS      = ['keV','angs','angstrom','kev']
 ALLOWED_TELESCOPES = ['HETG','ACIS']
@@ -12,43 +19,230 @@ ALLOWED_TELESCOPES = ['HETG','ACIS']
 CONST_HC    = 12.398418573430595   # Copied from ISIS, [keV angs]
 UNIT_LABELS = dict(zip(ALLOWED_UNITS, ['Energy (keV)', 'Wavelength (angs)']))
 
+# the number of fused responses kept in `_FUSED_RESPONSES` for
+# each pair of RMF and ARF
+MAX_FUSED_RESPONSES = 32
+
+# the fused ARF x RMF responses, shared between all spectra with the same
+# RMF and ARF objects, exposure, noticed channels, grouping and model grid.
+# They are keyed weakly by the RMF and then by the ARF (or the RMF again,
+# for spectra without an ARF), so they are dropped as soon as the
+# responses are no longer used, e.g. after the registry evicts them.
+_FUSED_RESPONSES = weakref.WeakKeyDictionary()
+_FUSED_LOCK = threading.Lock()
+
+def _is_wavelength(unit):
+    return unit is not None and unit.lower() in ['angs', 'angstrom']
+
+def _array_key(values):
+    if values is None:
+        return None
+    values = np.ascontiguousarray(values)
+    return (values.dtype.str, values.shape,
+            hashlib.sha1(values.view(np.uint8)).hexdigest())
+
+def _shared_fused_responses(rmf, arf, key):
+    """
+    The dict of fused responses of `rmf` and `arf` for `key`, shared
+    between all spectra; it is created empty if there is none yet.
+    """
+    with _FUSED_LOCK:
+        by_arf = _FUSED_RESPONSES.setdefault(rmf,
+                                             weakref.WeakKeyDictionary())
+        entries = by_arf.setdefault(rmf if arf is None else arf,
+                                    OrderedDict())
+
+        # mark as most recently used
+        cache = entries.pop(key, None)
+        if cache is None:
+            cache = {}
+        entries[key] = cache
+
+        while len(entries) > MAX_FUSED_RESPONSES:
+            entries.popitem(last=False)
+
+    return cache
+
 # Not a very smart reader, but it works for HETG
 class XSpectrum(object):
     def __init__(self, filename, telescope='HETG'):
         assert telescope in ALLOWED_TELESCOPES
 
         self.__store_path(filename)
+        self._init_state()
 
         if telescope == 'HETG':
             self._read_chandra(filename)
         elif telescope == 'ACIS':
             self._read_chandra(filename)
 
-        if self.bin_unit != self.arf.e_unit:
-            print("Warning: ARF units and pha file units are not the same!!!")
+        return
+
+    @classmethod
+    def from_arrays(cls, bin_lo, bin_hi, bin_unit, counts, rmf=None, arf=None,
+                    rmf_file=None, arf_file=None, exposure=1.0, grouping=None,
+                    path=None):
+        """
+        Create a spectrum from arrays rather than a PHA file. The arrays
+        are not copied, so they may be views into larger arrays shared
+        between many spectra (see `PHAII`).
+
+        Parameters
+        ----------
+        bin_lo, bin_hi : numpy.ndarray
+            The edges of the channel bins
+
+        bin_unit : str
+            The unit of the channel bins
+
+        counts : numpy.ndarray
+            The counts in each channel
+
+        rmf : RMF, default None
+            The RMF of the spectrum
+
+        arf : ARF, default None
+            The ARF of the spectrum
+
+        rmf_file, arf_file : str, default None
+            The files to load the RMF and ARF from when they are first
+            used, if `rmf` and `arf` are not given
+
+        exposure : float, default 1.0
+            The exposure time in seconds
+
+        grouping : numpy.ndarray, default None
+            The GROUPING column of the spectrum, see `group_pha`
+
+        path : str, default None
+            The directory of the file the spectrum was read from
+
+        Returns
+        -------
+        spec : XSpectrum
+            The spectrum
+        """
+        spec = cls.__new__(cls)
+        spec.path = path
+        spec._init_state()
+
+        spec._set_data(bin_lo, bin_hi, bin_unit, counts, grouping)
+        spec.rmf_file = rmf_file
+        spec.arf_file = arf_file
+        if rmf is not None:
+            spec.rmf = rmf
+        if arf is not None:
+            spec.arf = arf
+        spec.exposure = exposure
+
+        return spec
+
+    def _init_state(self):
+        # the responses, loaded from `rmf_file` and `arf_file`
+        # when they are first used
+        self.rmf_file = None
+        self.arf_file = None
+        self._rmf = None
+        self._arf = None
+
+        # cache for the fused ARF x RMF response, as (exposure, dict)
+        self._resp_cache = None
+
+        # the grid the model flux is given on, and the operator that
+        # rebins it onto the response grid; None for the response grid
+        self.model_grid = None
+        self._rebin = None
+
+        # read-only bins and counts in each unit, see `_change_units`
+        self._clear_unit_views()
+
+        # the noticed channels; None if all channels are noticed
+        self.channel_mask = None
+
+        # the group of each channel; None if the spectrum is not grouped
+        self.group_ids = None
+
+        # the operator that sums the noticed channels into groups,
+        # see `_group_operator`
+        self._group_op = None
+
+        return
+
+    @property
+    def rmf(self):
+        """
+        The RMF of the spectrum. It is loaded from `rmf_file`
+        (through the response registry) when first used.
+        """
+        if self._rmf is None and self.rmf_file is not None:
+            self.rmf = RMF.load(self.rmf_file)
+        return self._rmf
 
-        if self.bin_unit != self.rmf.energ_unit:
+    @rmf.setter
+    def rmf(self, rmf):
+        if rmf is not None and self._chan_unit != rmf.energ_unit:
             print("Warning: RMF units and pha file units are not the same!!!")
 
+        self._rmf = rmf
+        self._resp_cache = None
+
+    @property
+    def arf(self):
+        """
+        The ARF of the spectrum. It is loaded from `arf_file`
+        (through the response registry) when first used.
+        """
+        if self._arf is None and self.arf_file is not None:
+            self.arf = ARF.load(self.arf_file)
+        return self._arf
+
+    @arf.setter
+    def arf(self, arf):
+        if arf is not None and self._chan_unit != arf.e_unit:
+            print("Warning: ARF units and pha file units are not the same!!!")
+
+        self._arf = arf
+        self._resp_cache = None
+
+    def preload(self):
+        """
+        Load the responses now rather than when they are first used,
+        e.g. before handing the spectrum to a batch job.
+        """
+        self.rmf
+        self.arf
+
         return
 
     def __store_path(self, filename):
         self.path = '/'.join(filename.split('/')[0:-1]) + "/"
         return
 
-    def apply_resp(self, mflux, exposure=None):
+    def apply_resp(self, mflux, exposure=None, pruned=False):
         """
         Given a model flux spectrum, apply the response. In cases where the
         spectrum has both an ARF and an RMF, apply both. Otherwise, apply
         whatever response is in RMF.
 
         The model flux spectrum *must* be created using the same units and
-        bins as in the ARF (where the ARF exists)!
+        bins as in the ARF (where the ARF exists), or on the grid set with
+        `set_model_grid`! If only some channels are
+        noticed (see `notice`), the model flux may instead be given only
+        for the energy bins in `energy_mask`, which are all the bins that
+        contribute to the noticed channels, with `pruned=True`.
+
+        With the default "numpy-sparse" backend of the RMF in a single
+        thread, the model is folded with the combined ARF x RMF response
+        (see `_fused_response`). Otherwise, it is folded with the ARF and
+        then with `RMF.apply_rmf`, using the backend and the number of
+        threads of the RMF.
 
         Parameters
         ----------
         mflux : iterable
-            A list or array with the model flux values in ergs/keV/s/cm^-2
+            A list or array with the model flux values in ergs/keV/s/cm^-2.
+            A 2D array of shape (n_models, n_energy) folds many model
+            spectra at once.
 
         exposure : float, default None
             By default, the exposure stored in the ARF will be used to compute
@@ -58,33 +252,521 @@ class XSpectrum(object):
             ARF), this keyword provides the functionality to override the
             default behaviour and manually set the exposure time to use.
 
+        pruned : bool, default False
+            If True, the model flux is only given for the energy bins
+            in `energy_mask`
+
         Returns
         -------
         count_model : numpy.ndarray
-            The model spectrum in units of counts/bin
+            The model spectrum in units of counts/bin, of shape
+            (n_channels,) or (n_models, n_channels), where n_channels
+            is the number of noticed channels
         """
 
-        if self.arf is not None:
-            mrate  = self.arf.apply_arf(mflux, exposure=exposure)
+        mflux = np.asarray(mflux, dtype=np.float64)
+
+        if not pruned and self._use_rmf_backend():
+            n_energy = len(self.rmf.energ_lo)
+            if self._rebin is not None:
+                n_energy = self._rebin.shape[0]
+            resp = None
         else:
-            mrate = mflux
+            resp = self._fused_response(exposure=exposure, pruned=pruned)
+            n_energy = resp.shape[0]
+
+        if mflux.shape[-1] != n_energy:
+            raise ValueError("The model flux has %i energy bins, but the "
+                             "%sresponse has %i." %
+                             (mflux.shape[-1], "pruned " if pruned else "",
+                              n_energy))
 
-        count_model = self.rmf.apply_rmf(mrate)
+        if resp is None:
+            return self._apply_resp_backend(mflux, exposure)
+
+        count_model = resp.T.dot(mflux.T).T
 
         return count_model
 
+    def _use_rmf_backend(self):
+        """
+        Whether to fold with the backend of the RMF rather than
+        the fused response, see `apply_resp`.
+        """
+        return self.rmf.backend != "numpy-sparse" or \
+               self.rmf._n_threads(None) > 1
+
+    def _apply_resp_backend(self, mflux, exposure=None):
+        """
+        Fold a model flux through the model grid, the ARF and the RMF
+        (with its backend) one after another, and keep the noticed
+        channels and groups; the same as the fused response.
+        """
+        if self._rebin is not None:
+            mflux = self._rebin.T.dot(mflux.T).T
+        if self.arf is not None:
+            mflux = self.arf.apply_arf(mflux, exposure=exposure)
+
+        counts = self.rmf.apply_rmf(mflux)
+
+        if self.channel_mask is not None:
+            counts = counts[..., self.channel_mask]
+        if self.group_ids is not None:
+            counts = self._group_operator().dot(counts.T).T
+
+        return counts
+
+    def _apply_resp_adjoint_backend(self, counts, exposure=None):
+        """
+        The transpose of `_apply_resp_backend`.
+        """
+        if self.group_ids is not None:
+            counts = self._group_operator().T.dot(counts.T).T
+        if self.channel_mask is not None:
+            full = np.zeros(counts.shape[:-1] + (len(self.channel_mask),))
+            full[..., self.channel_mask] = counts
+            counts = full
+
+        grad = self.rmf.apply_rmf_transpose(counts)
+
+        if self.arf is not None:
+            grad = self.arf.apply_arf(grad, exposure=exposure)
+        if self._rebin is not None:
+            grad = self._rebin.dot(grad.T).T
+
+        return grad
+
+    def low_rank_response(self, tol=1e-3, max_rank=None, exposure=None):
+        """
+        Build a low-rank approximation of the combined response used by
+        `apply_resp`, for fast approximate folding (see `clarsach.lowrank`).
+
+        Parameters
+        ----------
+        tol : float, default 1e-3
+            The largest discarded singular value, relative to the
+            largest singular value
+
+        max_rank : int, default None
+            If given, the largest rank of the approximation
+
+        exposure : float, default None
+            The exposure time; if None, the exposure in the ARF is used
+
+        Returns
+        -------
+        resp : LowRankResponse
+            The approximation; fold model spectra with its `apply` method,
+            and see its `max_residual` for the achieved accuracy
+        """
+        return LowRankResponse(self._fused_response(exposure=exposure),
+                               tol=tol, max_rank=max_rank)
+
+    def apply_resp_adjoint(self, counts, exposure=None):
+        """
+        Apply the transpose of the response (ARF and RMF) to a vector in
+        channel space. This is the adjoint of `apply_resp`: given the
+        gradient of a fit statistic with respect to the folded model
+        (e.g. from `clarsach.stats`), it returns the gradient with
+        respect to the model flux.
+
+        Parameters
+        ----------
+        counts : numpy.ndarray
+            The channel-space vector, of shape (n_channels,) or
+            (n_models, n_channels), where n_channels is the number of
+            noticed channels
+
+        exposure : float, default None
+            The exposure time, see `apply_resp`
+
+        Returns
+        -------
+        grad : numpy.ndarray
+            The result on the full energy grid of the model flux, of
+            shape (n_energy,) or (n_models, n_energy)
+        """
+        counts = np.asarray(counts, dtype=np.float64)
+        if self._use_rmf_backend():
+            return self._apply_resp_adjoint_backend(counts, exposure)
+
+        resp = self._fused_response(exposure=exposure)
+
+        return resp.dot(counts.T).T
+
+    def _fused_response(self, exposure=None, pruned=False):
+        """
+        Return the combined ARF x RMF response as a sparse matrix.
+
+        The rows of the RMF's sparse matrix are scaled by the effective
+        area times the exposure, such that folding a model flux spectrum
+        is a single product with the combined matrix. Only the columns
+        of the noticed channels are kept, and if the spectrum is grouped,
+        the channels in each group are summed, and if a model grid is set
+        (see `set_model_grid`), the rows are those of the model grid. The
+        result is shared between all spectra with the same RMF and ARF
+        objects, exposure, noticed channels, grouping and model grid
+        (e.g. spectra with responses from the registry, or in a worker
+        of `clarsach.parallel.fit_catalog`), so it is built only once;
+        up to `MAX_FUSED_RESPONSES` of them are kept per RMF and ARF,
+        for as long as the RMF and ARF are in use.
+
+        Parameters
+        ----------
+        exposure : float, default None
+            The exposure time; if None, the exposure in the ARF is used
+
+        pruned : bool, default False
+            If True, only keep the rows of the energy bins that
+            contribute to the noticed channels (see `energy_mask`)
+
+        Returns
+        -------
+        resp : scipy.sparse.csr_matrix
+            The combined response of shape (n_energy, n_channels), where
+            n_energy is the number of bins of the model grid and
+            n_channels is the number of noticed channels (or groups)
+        """
+        if self.arf is not None and exposure is None:
+            exposure = self.arf.exposure
+
+        if self._resp_cache is None or self._resp_cache[0] != exposure:
+            key = (exposure, _array_key(self.channel_mask),
+                   _array_key(self.group_ids),
+                   None if self.model_grid is None else
+                   tuple(_array_key(e) for e in self.model_grid))
+            self._resp_cache = (exposure, _shared_fused_responses(
+                self.rmf, self.arf, key))
+        cache = self._resp_cache[1]
+
+        if "full" not in cache:
+            if self.arf is not None:
+                effarea = np.asarray(self.arf.specresp,
+                                     dtype=np.float64) * exposure
+                resp = scipy.sparse.diags(effarea).dot(self.rmf.sparse_matrix)
+                resp = resp.tocsr()
+            else:
+                resp = self.rmf.sparse_matrix
+
+            if self.channel_mask is not None:
+                resp = resp[:, self.channel_mask]
+
+            if self.group_ids is not None:
+                # sum the channels in each group
+                resp = resp.dot(self._group_operator().T).tocsr()
+
+            if self._rebin is not None:
+                # rebin the model flux onto the response grid first
+                resp = self._rebin.dot(resp).tocsr()
+
+            # keep it in float64 even for a compact RMF, since scipy
+            # would convert a float32 matrix to float64 on every fold
+            cache["full"] = resp.astype(np.float64, copy=False)
+
+        if not pruned:
+            return cache["full"]
+
+        if "pruned" not in cache:
+            resp = cache["full"]
+            cache["pruned"] = resp[np.diff(resp.indptr) > 0]
+
+        return cache["pruned"]
+
+    def set_model_grid(self, ener_lo=None, ener_hi=None):
+        """
+        Set the energy grid the model flux is given on, if it differs
+        from the energy grid of the response.
+
+        The operator that rebins the model flux onto the response grid
+        (see `clarsach.rebin.rebin_matrix`) is built once and fused into
+        the combined response, so folding a model on its own grid costs
+        no more than folding it on the response grid.
+
+        Parameters
+        ----------
+        ener_lo, ener_hi : iterable, default None
+            The edges of the bins of the model grid, in increasing order
+            and in the energy units of the response; None to use the
+            grid of the response again
+        """
+        if ener_lo is None:
+            self.model_grid = None
+            self._rebin = None
+        else:
+            ener_lo = np.asarray(ener_lo, dtype=np.float64)
+            ener_hi = np.asarray(ener_hi, dtype=np.float64)
+            if self.arf is not None:
+                resp_lo, resp_hi = self.arf.e_low, self.arf.e_high
+            else:
+                resp_lo, resp_hi = self.rmf.energ_lo, self.rmf.energ_hi
+
+            self.model_grid = (ener_lo, ener_hi)
+            self._rebin = rebin_matrix(ener_lo, ener_hi, resp_lo, resp_hi)
+
+        self._resp_cache = None
+
+        return
+
+    @property
+    def energy_mask(self):
+        """
+        The energy bins of the model flux that contribute
+        to the noticed channels.
+        """
+        resp = self._fused_response()
+        return np.diff(resp.indptr) > 0
+
+    @property
+    def noticed_counts(self):
+        """
+        The counts in the noticed channels, or summed in each
+        group if the spectrum is grouped, in the channel order of
+        the response (see `apply_resp`).
+        """
+        counts = self._chan_counts
+        if self.channel_mask is not None:
+            counts = counts[self.channel_mask]
+        if self.group_ids is not None:
+            counts = self._group_operator().dot(counts)
+        return counts
+
+    def _group_operator(self):
+        """
+        The sparse matrix that sums the noticed channels into groups;
+        groups without any noticed channels are dropped. It is built
+        once whenever the grouping or the noticed channels change.
+        """
+        return self._group_op
+
+    def _build_group_operator(self):
+        group_ids = self.group_ids
+        if self.channel_mask is not None:
+            group_ids = group_ids[self.channel_mask]
+
+        # renumber the groups that are left consecutively
+        _, group_ids = np.unique(group_ids, return_inverse=True)
+        group_ids = np.ravel(group_ids)
+
+        n_chan = len(group_ids)
+        return scipy.sparse.csr_matrix((np.ones(n_chan),
+                                        (group_ids, np.arange(n_chan))),
+                                       shape=(np.max(group_ids) + 1
+                                              if n_chan else 0, n_chan))
+
+    def group_counts(self, min_counts):
+        """
+        Group consecutive channels such that each group has at least
+        `min_counts` counts. The last group may have fewer counts. The
+        channels are grouped in the channel order of the response, even
+        if the units were changed with `hard_set_units`.
+
+        Parameters
+        ----------
+        min_counts : int
+            The minimum number of counts per group
+        """
+        if min_counts <= 0:
+            raise ValueError("The minimum number of counts must be positive.")
+
+        counts = np.asarray(self._chan_counts, dtype=np.float64)
+        cumcounts = np.cumsum(counts)
+
+        # the first channel of each group
+        starts = [0]
+        total = 0.0
+        while True:
+            end = np.searchsorted(cumcounts, total + min_counts)
+            if end + 1 >= len(counts):
+                break
+            starts.append(end + 1)
+            total = cumcounts[end]
+
+        group_ids = np.zeros(len(counts), dtype=np.int64)
+        group_ids[starts[1:]] = 1
+
+        self._set_grouping(np.cumsum(group_ids))
+
+        return
+
+    def group_snr(self, min_snr):
+        """
+        Group consecutive channels such that each group has a signal to
+        noise ratio of at least `min_snr`. With Poisson noise on the
+        counts N in a group, the signal to noise ratio is sqrt(N), so
+        this is the same as `group_counts` with `min_snr**2` counts.
+
+        Parameters
+        ----------
+        min_snr : float
+            The minimum signal to noise ratio per group
+        """
+        self.group_counts(np.ceil(min_snr**2))
+
+        return
+
+    def group_bins(self, factor):
+        """
+        Group every `factor` consecutive channels.
+
+        Parameters
+        ----------
+        factor : int
+            The number of channels per group
+        """
+        self._set_grouping(np.arange(len(self._chan_counts)) // int(factor))
+
+        return
+
+    def group_pha(self):
+        """
+        Group the channels with the GROUPING column of the PHA file,
+        where 1 marks the first channel of a group and -1 the channels
+        that continue it.
+        """
+        if self.grouping is None:
+            raise ValueError("The PHA file has no GROUPING column.")
+
+        self._set_grouping(np.cumsum(np.asarray(self.grouping) != -1) - 1)
+
+        return
+
+    def ungroup(self):
+        """
+        Remove the grouping of the channels.
+        """
+        self._set_grouping(None)
+
+        return
+
+    def _set_grouping(self, group_ids):
+        self.group_ids = group_ids
+        self._channels_changed()
+
+        return
+
+    def _channels_changed(self):
+        """
+        Rebuild the group operator and clear the cached response after
+        the grouping or the noticed channels have changed.
+        """
+        if self.group_ids is None:
+            self._group_op = None
+        else:
+            self._group_op = self._build_group_operator()
+        self._resp_cache = None
+
+        return
+
+    def notice(self, lo=None, hi=None, unit='keV'):
+        """
+        Notice all channels that overlap the range between `lo` and `hi`.
+
+        If no channels have been noticed or ignored before, all channels
+        outside of the range are ignored; otherwise, the channels in the
+        range are added to the noticed channels. The response used in
+        `apply_resp` only includes the noticed channels.
+
+        Parameters
+        ----------
+        lo, hi : float, default None
+            The lower and upper end of the range; None means no limit
+
+        unit : str, default 'keV'
+            The unit of `lo` and `hi`, either energy or wavelength
+            (one of `ALLOWED_UNITS`)
+        """
+        if self.channel_mask is None:
+            self.channel_mask = np.zeros(len(self._chan_lo), dtype=bool)
+
+        self.channel_mask = self.channel_mask | \
+                            self._channels_in_range(lo, hi, unit)
+        self._channels_changed()
+
+        return
+
+    def ignore(self, lo=None, hi=None, unit='keV'):
+        """
+        Ignore all channels that overlap the range between `lo` and `hi`.
+
+        Parameters
+        ----------
+        lo, hi : float, default None
+            The lower and upper end of the range; None means no limit
+
+        unit : str, default 'keV'
+            The unit of `lo` and `hi`, either energy or wavelength
+            (one of `ALLOWED_UNITS`)
+        """
+        if self.channel_mask is None:
+            self.channel_mask = np.ones(len(self._chan_lo), dtype=bool)
+
+        self.channel_mask = self.channel_mask & \
+                            ~self._channels_in_range(lo, hi, unit)
+        self._channels_changed()
+
+        return
+
+    def notice_all(self):
+        """
+        Notice all channels again.
+        """
+        self.channel_mask = None
+        self._channels_changed()
+
+        return
+
+    def _channels_in_range(self, lo, hi, unit):
+        """
+        The channels whose bins overlap the range between `lo` and `hi`,
+        in the native channel order of the spectrum.
+        """
+        assert unit in ALLOWED_UNITS
+
+        if _is_wavelength(unit) != _is_wavelength(self._chan_unit):
+            lo, hi = (None if hi is None else CONST_HC / hi,
+                      None if lo is None else CONST_HC / lo)
+
+        in_range = np.ones(len(self._chan_lo), dtype=bool)
+        if lo is not None:
+            in_range &= (self._chan_hi > lo)
+        if hi is not None:
+            in_range &= (self._chan_lo < hi)
+
+        return in_range
+
     @property
     def bin_mid(self):
-        return 0.5 * (self.bin_lo + self.bin_hi)
+        return self._change_units(self.bin_unit)[2]
 
     @property
     def is_monotonically_increasing(self):
-        return all(self.bin_lo[1:] > self.bin_lo[:-1])
+        if self._monotonic is None:
+            bin_lo = np.asarray(self.bin_lo)
+            self._monotonic = bool(np.all(bin_lo[1:] > bin_lo[:-1]))
+        return self._monotonic
 
     def _change_units(self, unit):
+        """
+        The bin edges, bin centres and counts of the spectrum in `unit`.
+
+        The arrays are read-only and computed once per unit; they are
+        kept until the data or its units are changed.
+        """
         assert unit in ALLOWED_UNITS
+        if unit not in self._unit_views:
+            views = self._convert_units(unit)
+            for v in views:
+                v.flags.writeable = False
+            self._unit_views[unit] = views
+
+        return self._unit_views[unit]
+
+    def _convert_units(self, unit):
         if unit == self.bin_unit:
-            return (self.bin_lo, self.bin_hi, self.bin_mid, self.counts)
+            bin_lo = np.asarray(self.bin_lo)
+            bin_hi = np.asarray(self.bin_hi)
+            return (bin_lo.view(), bin_hi.view(), 0.5 * (bin_lo + bin_hi),
+                    np.asarray(self.counts).view())
         else:
             # Need to use reverse values if the bins are listed in increasing order
             if self.is_monotonically_increasing:
@@ -98,18 +780,26 @@ class XSpectrum(object):
             new_lo  = CONST_HC/self.bin_hi[sl]
             new_hi  = CONST_HC/self.bin_lo[sl]
             new_mid = 0.5 * (new_lo + new_hi)
-            new_cts = self.counts[sl]
+            new_cts = np.asarray(self.counts)[sl]
             return (new_lo, new_hi, new_mid, new_cts)
 
     def hard_set_units(self, unit):
         new_lo, new_hi, new_mid, new_cts = self._change_units(unit)
-        self.bin_lo = new_lo
-        self.bin_hi = new_hi
-        self.counts = new_cts
+        self.bin_lo = np.array(new_lo)
+        self.bin_hi = np.array(new_hi)
+        self.counts = np.array(new_cts)
         self.bin_unit = unit
 
+        # the cached views and response are no longer valid
+        self._clear_unit_views()
+        self._resp_cache = None
+
         return
 
+    def _clear_unit_views(self):
+        self._unit_views = {}
+        self._monotonic  = None
+
     def plot(self, ax, xunit='keV', **kwargs):
         lo, hi, mid, cts = self._change_units(xunit)
         counts_err       = np.sqrt(cts)
@@ -121,21 +811,40 @@ class XSpectrum(object):
 
         return ax
 
+    def _set_data(self, bin_lo, bin_hi, bin_unit, counts, grouping):
+        self.bin_lo   = bin_lo
+        self.bin_hi   = bin_hi
+        self.bin_unit = bin_unit
+        self.counts   = counts
+        self.grouping = grouping
+
+        # the channel bins and counts in the order of the response, which
+        # is kept when the units are changed with `hard_set_units`
+        self._chan_lo     = np.asarray(bin_lo)
+        self._chan_hi     = np.asarray(bin_hi)
+        self._chan_unit   = bin_unit
+        self._chan_counts = np.asarray(counts)
+
+        self._clear_unit_views()
+
+        return
+
     def _read_chandra(self, filename):
         this_dir = os.path.dirname(os.path.abspath(filename))
         ff   = fits.open(filename)
         data = ff[1].data
         hdr = ff[1].header
 
-        self.bin_lo   = data['BIN_LO']
-        self.bin_hi   = data['BIN_HI']
-        self.bin_unit = data.columns['BIN_LO'].unit
-        self.counts   = data['COUNTS']
+        if "GROUPING" in data.columns.names:
+            grouping = np.array(data['GROUPING'])
+        else:
+            grouping = None
+
+        self._set_data(data['BIN_LO'], data['BIN_HI'],
+                       data.columns['BIN_LO'].unit, data['COUNTS'], grouping)
 
         self.rmf_file = this_dir + "/" + hdr['RESPFILE']
         self.arf_file = this_dir + "/" + hdr['ANCRFILE']
-        self.rmf = RMF(self.rmf_file)
-        self.arf = ARF(self.arf_file)
 
         if "EXPOSURE" in list(hdr.keys()):
             self.exposure = hdr['EXPOSURE']  # seconds
@@ -144,4 +853,139 @@ class XSpectrum(object):
 
         ff.close()
 
-        return
\ No newline at end of file
+        return
+
+
+class PHAII(object):
+    """
+    A PHA type II file, with many spectra in one table (e.g. the
+    orders and arms of a Chandra HETG observation from TGCat).
+
+    The table is read once into arrays with one row per spectrum.
+    Indexing returns an `XSpectrum` for a single row, which is created
+    on first access and shares the arrays of the table; its responses
+    are loaded through the response registry when first used, so
+    spectra with the same response files share them.
+
+    Parameters
+    ----------
+    filename : str
+        The file name of the PHA type II file
+
+    rmf_files, arf_files : str or list of str, default None
+        The response files for all spectra (a single file name) or for
+        each spectrum (a list). By default, the RESPFILE and ANCRFILE
+        columns or header keywords are used, if they exist. Relative
+        paths are relative to the directory of `filename`.
+
+    Attributes
+    ----------
+    bin_lo, bin_hi : numpy.ndarray
+        The edges of the channel bins, of shape (n_spectra, n_channels)
+
+    bin_unit : str
+        The unit of the channel bins
+
+    counts : numpy.ndarray
+        The counts, of shape (n_spectra, n_channels)
+
+    exposure : numpy.ndarray
+        The exposure time of each spectrum
+
+    columns : dict
+        All other scalar columns (e.g. TG_M, TG_PART, SPEC_NUM),
+        with one value per spectrum
+    """
+    def __init__(self, filename, rmf_files=None, arf_files=None):
+        self.filename = filename
+        self.path = os.path.dirname(os.path.abspath(filename))
+
+        self._read_pha2(filename)
+
+        self.rmf_files = self._response_files(rmf_files, 'RESPFILE')
+        self.arf_files = self._response_files(arf_files, 'ANCRFILE')
+
+        self._spectra = {}
+
+    def _read_pha2(self, filename):
+        ff = fits.open(filename)
+        h = ff['SPECTRUM'] if 'SPECTRUM' in ff else ff[1]
+        data = h.data
+        hdr = h.header
+
+        n_spec = len(data)
+
+        self.counts   = np.atleast_2d(np.array(data['COUNTS']))
+        self.bin_lo   = np.atleast_2d(np.array(data['BIN_LO']))
+        self.bin_hi   = np.atleast_2d(np.array(data['BIN_HI']))
+        self.bin_unit = data.columns['BIN_LO'].unit
+
+        if "GROUPING" in data.columns.names:
+            self.grouping = np.atleast_2d(np.array(data['GROUPING']))
+        else:
+            self.grouping = None
+
+        if "EXPOSURE" in data.columns.names:
+            self.exposure = np.array(data['EXPOSURE'], dtype=np.float64)
+        else:
+            self.exposure = np.zeros(n_spec) + hdr.get('EXPOSURE', 1.0)
+
+        # keep all other one-value-per-spectrum columns
+        self.columns = {}
+        for name in data.columns.names:
+            values = data[name]
+            if np.ndim(values) == 1 and name != 'EXPOSURE':
+                self.columns[name] = np.array(values)
+
+        self._header = hdr
+        ff.close()
+
+        return
+
+    def _response_files(self, files, key):
+        """
+        The response file of each spectrum, or None if there is none.
+        """
+        n_spec = len(self)
+
+        if files is None:
+            if key in self.columns:
+                files = [str(f).strip() for f in self.columns[key]]
+            else:
+                files = self._header.get(key, None)
+
+        if files is None or isinstance(files, str):
+            files = [files] * n_spec
+
+        if len(files) != n_spec:
+            raise ValueError("There must be one %s per spectrum." % key)
+
+        return [None if f is None or f.lower() in ['', 'none']
+                else os.path.join(self.path, f) for f in files]
+
+    def __len__(self):
+        return self.counts.shape[0]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("Spectrum index out of range.")
+
+        if i not in self._spectra:
+            grouping = None if self.grouping is None else self.grouping[i]
+
+            spec = XSpectrum.from_arrays(self.bin_lo[i], self.bin_hi[i],
+                                         self.bin_unit, self.counts[i],
+                                         rmf_file=self.rmf_files[i],
+                                         arf_file=self.arf_files[i],
+                                         exposure=self.exposure[i],
+                                         grouping=grouping,
+                                         path=self.path + "/")
+            self._spectra[i] = spec
+
+        return self._spectra[i]
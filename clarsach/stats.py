@@ -0,0 +1,247 @@
+"""
+Fit statistics for folded model spectra.
+
+All statistics take the observed counts per channel and the folded model
+in counts per channel (e.g. the output of `XSpectrum.apply_resp`). The
+model may be a single spectrum of shape (n_channels,) or a batch of
+spectra of shape (n_models, n_channels); the statistics are summed over
+the last axis. The gradients are taken with respect to the folded model
+and have the same shape as the model; the gradient with respect to the
+model flux follows by applying `XSpectrum.apply_resp_adjoint` to them.
+"""
+
+import numpy as np
+import scipy.special
+
+__all__ = ["poisson_loglike", "poisson_loglike_grad",
+           "cash", "cash_grad",
+           "cstat", "cstat_grad",
+           "wstat", "wstat_grad",
+           "chi2", "chi2_grad"]
+
+
+
+def _as_arrays(counts, model):
+    return np.asarray(counts, dtype=np.float64), \
+           np.asarray(model, dtype=np.float64)
+
+
+def poisson_loglike(counts, model):
+    """
+    The Poisson log-likelihood of the counts given the model,
+    sum(d * log(m) - m - log(d!)).
+
+    Parameters
+    ----------
+    counts : numpy.ndarray
+        The observed counts per channel
+
+    model : numpy.ndarray
+        The model counts per channel, of shape (n_channels,) or
+        (n_models, n_channels)
+
+    Returns
+    -------
+    loglike : float or numpy.ndarray
+        The log-likelihood, of shape model.shape[:-1]
+    """
+    counts, model = _as_arrays(counts, model)
+    loglike = scipy.special.xlogy(counts, model) - model - \
+              scipy.special.gammaln(counts + 1)
+    return np.sum(loglike, axis=-1)
+
+
+def poisson_loglike_grad(counts, model):
+    """
+    The gradient of `poisson_loglike` with respect to the model,
+    d / m - 1.
+    """
+    counts, model = _as_arrays(counts, model)
+    return _safe_ratio(counts, model) - 1.0
+
+
+def cash(counts, model):
+    """
+    The Cash statistic, 2 * sum(m - d * log(m)).
+
+    Parameters
+    ----------
+    counts : numpy.ndarray
+        The observed counts per channel
+
+    model : numpy.ndarray
+        The model counts per channel, of shape (n_channels,) or
+        (n_models, n_channels)
+
+    Returns
+    -------
+    stat : float or numpy.ndarray
+        The statistic, of shape model.shape[:-1]
+    """
+    counts, model = _as_arrays(counts, model)
+    return 2.0 * np.sum(model - scipy.special.xlogy(counts, model), axis=-1)
+
+
+def cash_grad(counts, model):
+    """
+    The gradient of `cash` with respect to the model, 2 * (1 - d / m).
+    """
+    counts, model = _as_arrays(counts, model)
+    return 2.0 * (1.0 - _safe_ratio(counts, model))
+
+
+def cstat(counts, model):
+    """
+    The C-statistic as used in XSPEC,
+    2 * sum(m - d + d * (log(d) - log(m))).
+
+    This differs from `cash` by a term that only depends on the data,
+    such that it approaches a chi-square distribution for many counts.
+
+    Parameters
+    ----------
+    counts : numpy.ndarray
+        The observed counts per channel
+
+    model : numpy.ndarray
+        The model counts per channel, of shape (n_channels,) or
+        (n_models, n_channels)
+
+    Returns
+    -------
+    stat : float or numpy.ndarray
+        The statistic, of shape model.shape[:-1]
+    """
+    counts, model = _as_arrays(counts, model)
+    stat = model - counts + scipy.special.xlogy(counts, counts) - \
+           scipy.special.xlogy(counts, model)
+    return 2.0 * np.sum(stat, axis=-1)
+
+
+def cstat_grad(counts, model):
+    """
+    The gradient of `cstat` with respect to the model, 2 * (1 - d / m).
+    """
+    return cash_grad(counts, model)
+
+
+def _wstat_background(counts, model, bkg_counts, alpha):
+    """
+    The background counts per channel that maximize the likelihood
+    for a given model, in units of the source exposure.
+    """
+    # exposure of the source (1) plus the background (1 / alpha)
+    t = 1.0 + 1.0 / alpha
+
+    a = counts + bkg_counts - t * model
+    d = np.sqrt(a**2 + 4.0 * t * bkg_counts * model)
+
+    # (a + d) / (2 t), rewritten where a < 0 to avoid cancellation
+    with np.errstate(divide="ignore", invalid="ignore"):
+        f = np.where(a >= 0, (a + d) / (2.0 * t),
+                     2.0 * bkg_counts * model / (d - a))
+    return np.where(np.isfinite(f), f, 0.0)
+
+
+def wstat(counts, model, bkg_counts, alpha):
+    """
+    The W-statistic as used in XSPEC, for source counts with a Poisson
+    background measured separately, where the background level in each
+    channel is treated as a nuisance parameter and profiled out.
+
+    Parameters
+    ----------
+    counts : numpy.ndarray
+        The observed counts per channel in the source spectrum
+
+    model : numpy.ndarray
+        The source model counts per channel, of shape (n_channels,) or
+        (n_models, n_channels)
+
+    bkg_counts : numpy.ndarray
+        The observed counts per channel in the background spectrum
+
+    alpha : float or numpy.ndarray
+        The ratio of the source to the background exposure (times
+        the ratio of the BACKSCAL values)
+
+    Returns
+    -------
+    stat : float or numpy.ndarray
+        The statistic, of shape model.shape[:-1]
+    """
+    counts, model = _as_arrays(counts, model)
+    bkg_counts = np.asarray(bkg_counts, dtype=np.float64)
+
+    f = _wstat_background(counts, model, bkg_counts, alpha)
+    tb = 1.0 / alpha
+
+    xlogy = scipy.special.xlogy
+    stat = model + (1.0 + tb) * f - xlogy(counts, model + f) - \
+           xlogy(bkg_counts, tb * f) - counts + xlogy(counts, counts) - \
+           bkg_counts + xlogy(bkg_counts, bkg_counts)
+    return 2.0 * np.sum(stat, axis=-1)
+
+
+def wstat_grad(counts, model, bkg_counts, alpha):
+    """
+    The gradient of `wstat` with respect to the (source) model,
+    2 * (1 - d / (m + f)), where f is the profiled background.
+    """
+    counts, model = _as_arrays(counts, model)
+    bkg_counts = np.asarray(bkg_counts, dtype=np.float64)
+
+    f = _wstat_background(counts, model, bkg_counts, alpha)
+    return 2.0 * (1.0 - _safe_ratio(counts, model + f))
+
+
+def _chi2_sigma(counts, sigma):
+    if sigma is None:
+        # use the data variance, with a floor of 1 count
+        return np.sqrt(np.maximum(counts, 1.0))
+    return np.asarray(sigma, dtype=np.float64)
+
+
+def chi2(counts, model, sigma=None):
+    """
+    The chi-square statistic, sum((d - m)**2 / sigma**2).
+
+    Parameters
+    ----------
+    counts : numpy.ndarray
+        The observed counts per channel
+
+    model : numpy.ndarray
+        The model counts per channel, of shape (n_channels,) or
+        (n_models, n_channels)
+
+    sigma : numpy.ndarray, default None
+        The uncertainty on the counts; by default, sqrt(counts) is
+        used, with a minimum of 1
+
+    Returns
+    -------
+    stat : float or numpy.ndarray
+        The statistic, of shape model.shape[:-1]
+    """
+    counts, model = _as_arrays(counts, model)
+    sigma = _chi2_sigma(counts, sigma)
+    return np.sum(((counts - model) / sigma)**2, axis=-1)
+
+
+def chi2_grad(counts, model, sigma=None):
+    """
+    The gradient of `chi2` with respect to the model,
+    -2 * (d - m) / sigma**2.
+    """
+    counts, model = _as_arrays(counts, model)
+    sigma = _chi2_sigma(counts, sigma)
+    return -2.0 * (counts - model) / sigma**2
+
+
+def _safe_ratio(counts, model):
+    """
+    counts / model, where 0 / 0 is 0.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(counts == 0, 0.0, counts / model)
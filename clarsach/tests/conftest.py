@@ -0,0 +1,49 @@
+import os
+import shutil
+
+import numpy as np
+
+import astropy.io.fits as fits
+
+
+def make_fake_pha(dirname, exposure=1e4):
+    """
+    Write a fake PHA file with an ARF on the energy grid of
+    `data/PCU2.rsp`, which is copied alongside it as the RMF.
+    """
+    rmffile = os.path.join(dirname, "PCU2.rsp")
+    shutil.copy("data/PCU2.rsp", rmffile)
+
+    rmf_list = fits.open(rmffile)
+    energ_lo = rmf_list["SPECRESP MATRIX"].data.field("ENERG_LO")
+    energ_hi = rmf_list["SPECRESP MATRIX"].data.field("ENERG_HI")
+    e_min = rmf_list["EBOUNDS"].data.field("E_MIN")
+    e_max = rmf_list["EBOUNDS"].data.field("E_MAX")
+    rmf_list.close()
+
+    specresp = np.linspace(10.0, 100.0, len(energ_lo))
+    arf_hdu = fits.BinTableHDU.from_columns(
+        [fits.Column(name="ENERG_LO", format="E", unit="keV", array=energ_lo),
+         fits.Column(name="ENERG_HI", format="E", unit="keV", array=energ_hi),
+         fits.Column(name="SPECRESP", format="E", array=specresp)],
+        name="SPECRESP")
+    arf_hdu.header["EXPOSURE"] = exposure
+    arffile = os.path.join(dirname, "fake.arf")
+    arf_hdu.writeto(arffile)
+
+    counts = np.random.RandomState(20170726).poisson(50, size=len(e_min))
+    pha_hdu = fits.BinTableHDU.from_columns(
+        [fits.Column(name="CHANNEL", format="J",
+                     array=np.arange(len(e_min))),
+         fits.Column(name="BIN_LO", format="E", unit="keV", array=e_min),
+         fits.Column(name="BIN_HI", format="E", unit="keV", array=e_max),
+         fits.Column(name="COUNTS", format="J", array=counts)],
+        name="SPECTRUM")
+    pha_hdu.header["RESPFILE"] = "PCU2.rsp"
+    pha_hdu.header["ANCRFILE"] = "fake.arf"
+    pha_hdu.header["EXPOSURE"] = exposure
+    phafile = os.path.join(dirname, "fake.pha")
+    pha_hdu.writeto(phafile)
+
+    return phafile
+
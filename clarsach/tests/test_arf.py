@@ -46,4 +46,13 @@ class TestARF(object):
 
         m_arf = self.m * self.specresp
 
-        assert np.allclose(m_arf_c, m_arf)
\ No newline at end of file
+        assert np.allclose(m_arf_c, m_arf)
+
+    def test_batched_spectra_are_folded_row_by_row(self):
+        m_batch = np.outer(np.linspace(0.5, 2.0, 5), self.m)
+
+        m_arf_c = self.arf_c.apply_arf(m_batch)
+
+        assert m_arf_c.shape == m_batch.shape
+        for mm, mm_arf in zip(m_batch, m_arf_c):
+            assert np.allclose(self.arf_c.apply_arf(mm), mm_arf)
@@ -0,0 +1,98 @@
+import os
+import shutil
+import tempfile
+
+import pytest
+import numpy as np
+
+import astropy.io.fits as fits
+
+from clarsach.respond import ARF, RMF
+from clarsach.cache import cache_path
+
+
+class TestResponseCache(object):
+
+    @classmethod
+    def setup_class(cls):
+        cls.tmpdir = tempfile.mkdtemp()
+        cls.cache_dir = os.path.join(cls.tmpdir, "cache")
+
+        cls.rmffile = "data/PCU2.rsp"
+
+        energ = np.linspace(1.0, 10.0, 101)
+        hdu = fits.BinTableHDU.from_columns(
+            [fits.Column(name="ENERG_LO", format="E", unit="keV",
+                         array=energ[:-1]),
+             fits.Column(name="ENERG_HI", format="E", unit="keV",
+                         array=energ[1:]),
+             fits.Column(name="SPECRESP", format="E",
+                         array=np.linspace(10.0, 100.0, 100))],
+            name="SPECRESP")
+        hdu.header["EXPOSURE"] = 1e4
+        cls.arffile = os.path.join(cls.tmpdir, "fake.arf")
+        hdu.writeto(cls.arffile)
+
+    @classmethod
+    def teardown_class(cls):
+        shutil.rmtree(cls.tmpdir)
+
+    def test_rmf_cache_is_written(self):
+        RMF(self.rmffile, cache_dir=self.cache_dir)
+        assert os.path.isdir(cache_path(self.rmffile, self.cache_dir))
+
+    def test_cached_rmf_is_memory_mapped(self):
+        RMF(self.rmffile, cache_dir=self.cache_dir)
+        rmf = RMF(self.rmffile, cache_dir=self.cache_dir)
+
+        assert isinstance(rmf.matrix, np.memmap)
+
+    def test_compact_rmf_is_cached_compact(self):
+        RMF(self.rmffile, cache_dir=self.cache_dir)
+        RMF(self.rmffile, cache_dir=self.cache_dir, compact=True)
+        rmf = RMF(self.rmffile, cache_dir=self.cache_dir, compact=True)
+
+        assert cache_path(self.rmffile, self.cache_dir) != \
+               cache_path(self.rmffile, self.cache_dir, "compact")
+        assert isinstance(rmf.matrix, np.memmap)
+        assert rmf.matrix.dtype == np.float32
+        assert not rmf.sparse_matrix.data.flags.owndata
+        assert rmf.sparse_matrix.dtype == np.float32
+
+    def test_cached_rmf_matches_fits(self):
+        rmf = RMF(self.rmffile)
+        RMF(self.rmffile, cache_dir=self.cache_dir)
+        rmf_c = RMF(self.rmffile, cache_dir=self.cache_dir)
+
+        for name in ["energ_lo", "energ_hi", "n_grp", "f_chan", "n_chan",
+                     "matrix"]:
+            assert np.all(getattr(rmf, name) == getattr(rmf_c, name))
+
+        assert rmf.detchans == rmf_c.detchans
+        assert rmf.offset == rmf_c.offset
+        assert rmf.energ_unit == rmf_c.energ_unit
+
+        m = np.linspace(1.0, 2.0, len(rmf.energ_lo))
+        assert np.allclose(rmf.apply_rmf(m), rmf_c.apply_rmf(m))
+
+    def test_cached_arf_matches_fits(self):
+        arf = ARF(self.arffile)
+        ARF(self.arffile, cache_dir=self.cache_dir)
+        arf_c = ARF(self.arffile, cache_dir=self.cache_dir)
+
+        assert np.all(arf.specresp == arf_c.specresp)
+        assert np.all(arf.e_low == arf_c.e_low)
+        assert arf.exposure == arf_c.exposure
+        assert arf.fracexpo == arf_c.fracexpo
+        assert arf.e_unit == arf_c.e_unit
+
+    def test_cache_key_changes_with_file(self):
+        filename = os.path.join(self.tmpdir, "copy.rsp")
+        shutil.copy(self.rmffile, filename)
+        path1 = cache_path(filename, self.cache_dir)
+
+        with open(filename, "ab") as f:
+            f.write(b"\0" * 2880)
+        path2 = cache_path(filename, self.cache_dir)
+
+        assert path1 != path2
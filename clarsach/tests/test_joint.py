@@ -0,0 +1,76 @@
+import shutil
+import tempfile
+
+import numpy as np
+import scipy.stats
+
+from clarsach.spectrum import XSpectrum
+from clarsach.joint import JointSpectrum
+from clarsach.stats import poisson_loglike, poisson_loglike_grad
+from clarsach.models.powerlaw import Powerlaw
+from clarsach.tests.conftest import make_fake_pha
+
+
+class TestJointSpectrum(object):
+
+    @classmethod
+    def setup_class(cls):
+        cls.tmpdirs = [tempfile.mkdtemp() for i in range(2)]
+        cls.spectra = [XSpectrum(make_fake_pha(d, exposure=e),
+                                 telescope="ACIS")
+                       for d, e in zip(cls.tmpdirs, [1e4, 2e4])]
+
+        cls.joint = JointSpectrum(cls.spectra)
+        cls.pl = Powerlaw(norm=1.0, phoindex=2.0)
+
+    @classmethod
+    def teardown_class(cls):
+        for d in cls.tmpdirs:
+            shutil.rmtree(d)
+
+    def test_identical_grids_are_merged(self):
+        assert len(self.joint.energ_lo) == len(self.spectra[0].arf.e_low)
+
+    def test_folded_spectra_match_individual_spectra(self):
+        count_models, _ = self.joint.evaluate(self.pl)
+
+        for s, c in zip(self.spectra, count_models):
+            m = self.pl.calculate(s.arf.e_low, s.arf.e_high)
+            assert np.allclose(c, s.apply_resp(m))
+
+    def test_loglikelihood_is_sum_of_poisson_terms(self):
+        count_models, loglike = self.joint.evaluate(self.pl)
+
+        loglike_test = 0.0
+        for s, c in zip(self.spectra, count_models):
+            loglike_test += np.sum(scipy.stats.poisson.logpmf(s.counts, c))
+
+        assert np.isclose(loglike, loglike_test)
+
+    def test_batched_models(self):
+        m = self.pl.calculate(self.joint.energ_lo, self.joint.energ_hi)
+        m_batch = np.outer([0.5, 1.0, 2.0], m)
+
+        count_models, loglike = self.joint.evaluate(m_batch)
+
+        assert loglike.shape == (3,)
+        assert count_models[0].shape == (3, len(self.spectra[0].counts))
+        _, loglike1 = self.joint.evaluate(m)
+        assert np.isclose(loglike[1], loglike1)
+
+    def test_loglikelihood_gradient_through_response(self):
+        m = self.pl.calculate(self.joint.energ_lo, self.joint.energ_hi)
+        count_model = self.joint.apply_resp(m)
+        counts = np.random.RandomState(20170726).poisson(count_model)
+
+        grad = self.joint.apply_resp_adjoint(
+            poisson_loglike_grad(counts, count_model))
+
+        eps = 1e-3 * m
+        for i in [0, 50, 150]:
+            dm = np.zeros_like(m)
+            dm[i] = eps[i]
+            l_hi = poisson_loglike(counts, self.joint.apply_resp(m + dm))
+            l_lo = poisson_loglike(counts, self.joint.apply_resp(m - dm))
+            assert np.isclose(grad[i], (l_hi - l_lo) / (2 * eps[i]),
+                              rtol=1e-3)
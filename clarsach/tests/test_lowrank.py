@@ -0,0 +1,82 @@
+import pytest
+import numpy as np
+import scipy.sparse
+
+from clarsach.respond import RMF
+from clarsach.lowrank import LowRankResponse
+from clarsach.models.powerlaw import Powerlaw
+
+
+class TestLowRankResponse(object):
+
+    @classmethod
+    def setup_class(cls):
+        cls.rmf = RMF("data/PCU2.rsp")
+
+        pl = Powerlaw(norm=1.0, phoindex=2.0)
+        cls.m = np.array(pl.calculate(ener_lo=cls.rmf.energ_lo,
+                                      ener_hi=cls.rmf.energ_hi))
+
+    def test_error_is_bounded_by_tolerance(self):
+        tol = 1e-2
+        lr = self.rmf.low_rank(tol=tol)
+        assert lr.rank < min(self.rmf.sparse_matrix.shape)
+        assert lr.singular_values[lr.rank] <= tol * lr.singular_values[0]
+
+        err = lr.apply(self.m) - self.rmf.apply_rmf(self.m)
+        bound = tol * lr.singular_values[0] * np.linalg.norm(self.m)
+        assert np.linalg.norm(err) <= bound
+
+    def test_smaller_tolerance_is_more_accurate(self):
+        lr1 = self.rmf.low_rank(tol=1e-2)
+        lr2 = self.rmf.low_rank(tol=1e-4)
+        assert lr2.rank > lr1.rank
+        assert lr2.max_residual < lr1.max_residual
+        assert lr2.residual(self.m) < lr1.residual(self.m)
+
+    def test_max_residual_is_elementwise(self):
+        lr = self.rmf.low_rank(tol=1e-2)
+        dense = self.rmf.sparse_matrix.toarray()
+        approx = lr.left.dot(lr.right)
+        assert np.isclose(lr.max_residual,
+                          np.max(np.abs(approx - dense)) /
+                          np.max(np.abs(dense)))
+
+    def test_zero_tolerance_is_exact(self):
+        lr = self.rmf.low_rank(tol=0)
+        assert np.allclose(lr.apply(self.m), self.rmf.apply_rmf(self.m))
+        counts = np.ones(self.rmf.detchans)
+        assert np.allclose(lr.apply_transpose(counts),
+                           self.rmf.apply_rmf_transpose(counts))
+
+    def test_max_rank(self):
+        lr = self.rmf.low_rank(tol=0, max_rank=5)
+        assert lr.rank == 5
+        assert lr.left.shape == (len(self.rmf.n_grp), 5)
+        assert lr.right.shape == (5, self.rmf.detchans)
+
+    def test_batched_fold(self):
+        lr = self.rmf.low_rank(tol=1e-3)
+        m2 = np.vstack([self.m, 2 * self.m])
+        counts = lr.apply(m2)
+        assert counts.shape == (2, self.rmf.detchans)
+        assert np.allclose(counts[1], 2 * lr.apply(self.m))
+
+    def test_negative_tolerance_fails(self):
+        with pytest.raises(ValueError):
+            LowRankResponse(self.rmf.sparse_matrix, tol=-1)
+
+    def test_large_sparse_response(self):
+        # a response of rank 3 that is too large to handle as a dense
+        # matrix in a test
+        rng = np.random.RandomState(20171002)
+        u = scipy.sparse.random(8000, 3, density=0.05, random_state=rng)
+        v = scipy.sparse.random(3, 4000, density=0.05, random_state=rng)
+        matrix = u.dot(v).tocsr()
+
+        lr = LowRankResponse(matrix, tol=1e-8)
+        assert lr.rank == 3
+
+        m = rng.uniform(size=matrix.shape[0])
+        assert np.allclose(lr.apply(m), matrix.T.dot(m))
+        assert lr.max_residual < 1e-8
@@ -0,0 +1,208 @@
+import os
+import shutil
+import tempfile
+
+import pytest
+import numpy as np
+
+from clarsach.models import Model, Powerlaw, Gaussian, TabulatedAbsorption
+from clarsach.models import load_cross_sections
+
+
+class TestPowerlaw(object):
+
+    @classmethod
+    def setup_class(cls):
+        cls.ener_lo = np.linspace(0.5, 10.0, 200)
+        cls.ener_hi = cls.ener_lo + 0.05
+
+    def _direct(self, norm, phoindex):
+        if phoindex == 1.0:
+            return np.log(self.ener_hi) - np.log(self.ener_lo)
+        return -norm * self.ener_hi**(-phoindex+1) + \
+               norm * self.ener_lo**(-phoindex+1)
+
+    def test_calculate_matches_direct_formula(self):
+        for phoindex in [0.5, 1.0, 2.0, 3.3]:
+            pl = Powerlaw(norm=2.5, phoindex=phoindex)
+            m = pl.calculate(self.ener_lo, self.ener_hi)
+            assert np.allclose(m, self._direct(2.5, phoindex),
+                               rtol=1e-12, atol=0)
+
+    def test_unbound_model_fails(self):
+        pl = Powerlaw()
+        with pytest.raises(ValueError):
+            pl.evaluate()
+
+    def test_vectorized_evaluation(self):
+        pl = Powerlaw().bind(self.ener_lo, self.ener_hi)
+        params = np.array([[1.0, 2.0], [3.0, 1.0], [0.5, 1.7]])
+        m = pl.evaluate(params)
+        assert m.shape == (3, len(self.ener_lo))
+        for p, mi in zip(params, m):
+            assert np.allclose(mi, self._direct(*p), rtol=1e-12, atol=0)
+
+    def test_wrong_number_of_parameters_fails(self):
+        pl = Powerlaw().bind(self.ener_lo, self.ener_hi)
+        with pytest.raises(ValueError):
+            pl.evaluate([1.0, 2.0, 3.0])
+
+    def test_repeated_parameters_are_cached(self):
+        pl = Powerlaw(cache_size=2).bind(self.ener_lo, self.ener_hi)
+        m1 = pl.evaluate([1.0, 2.0])
+        assert pl.evaluate([1.0, 2.0]) is m1
+        assert not m1.flags.writeable
+
+        pl.evaluate([1.0, 2.1])
+        pl.evaluate([1.0, 2.2])
+        assert pl.evaluate([1.0, 2.0]) is not m1
+
+    def test_calculate_uses_current_parameters(self):
+        pl = Powerlaw(norm=1.0, phoindex=2.0)
+        m1 = pl.calculate(self.ener_lo, self.ener_hi)
+        pl.phoindex = 1.5
+        m2 = pl.calculate(self.ener_lo, self.ener_hi)
+        assert np.allclose(m2, self._direct(1.0, 1.5))
+        assert not np.allclose(m1, m2)
+
+    def test_calculate_returns_writable_copy(self):
+        pl = Powerlaw(norm=1.0, phoindex=2.0)
+        m = pl.calculate(self.ener_lo, self.ener_hi)
+        m *= 2.0
+
+        assert np.allclose(m, 2.0 * self._direct(1.0, 2.0))
+        assert np.allclose(pl.evaluate(), self._direct(1.0, 2.0))
+
+    def test_rebinding_clears_cache(self):
+        pl = Powerlaw()
+        m1 = pl.calculate(self.ener_lo, self.ener_hi)
+        m2 = pl.calculate(self.ener_lo[:10], self.ener_hi[:10])
+        assert len(m2) == 10
+        assert np.allclose(m2, m1[:10])
+
+    def test_base_class_has_no_evaluation(self):
+        m = Model().bind(self.ener_lo, self.ener_hi)
+        with pytest.raises(NotImplementedError):
+            m.evaluate([])
+
+
+class TestGaussian(object):
+
+    def test_integrates_to_norm(self):
+        ener = np.linspace(0.1, 20.0, 2001)
+        g = Gaussian(norm=3.0, line_e=6.4, sigma=0.2)
+        m = g.calculate(ener[:-1], ener[1:])
+        assert np.isclose(np.sum(m), 3.0)
+        assert np.argmax(m) == np.searchsorted(ener, 6.4) - 1
+
+
+class TestCompoundModel(object):
+
+    @classmethod
+    def setup_class(cls):
+        cls.ener_lo = np.linspace(0.5, 10.0, 200)
+        cls.ener_hi = cls.ener_lo + 0.05
+
+    def test_parameter_names(self):
+        m = Powerlaw() + Gaussian() + Powerlaw()
+        assert m.param_names == ["powerlaw1.norm", "powerlaw1.phoindex",
+                                 "gaussian.norm", "gaussian.line_e",
+                                 "gaussian.sigma",
+                                 "powerlaw2.norm", "powerlaw2.phoindex"]
+        assert m.n_params == 7
+
+    def test_sum_matches_components(self):
+        pl = Powerlaw(norm=2.0, phoindex=1.7)
+        g = Gaussian(norm=0.1, line_e=6.4, sigma=0.1)
+        m = (pl + g).calculate(self.ener_lo, self.ener_hi)
+
+        expected = Powerlaw(norm=2.0, phoindex=1.7).calculate(
+                       self.ener_lo, self.ener_hi) + \
+                   Gaussian(norm=0.1, line_e=6.4, sigma=0.1).calculate(
+                       self.ener_lo, self.ener_hi)
+        assert np.allclose(m, expected)
+
+    def test_batched_evaluation_matches_single(self):
+        model = (Powerlaw() + Gaussian()).bind(self.ener_lo, self.ener_hi)
+        rng = np.random.RandomState(20170726)
+        params = np.column_stack([rng.uniform(0.5, 2.0, 5),
+                                  rng.uniform(1.0, 3.0, 5),
+                                  rng.uniform(0.01, 0.1, 5),
+                                  rng.uniform(6.0, 7.0, 5),
+                                  rng.uniform(0.05, 0.2, 5)])
+        m = model.evaluate(params)
+        assert m.shape == (5, len(self.ener_lo))
+        for p, mi in zip(params, m):
+            assert np.allclose(model.evaluate(p), mi)
+
+    def test_additive_models_cannot_be_multiplied(self):
+        with pytest.raises(ValueError):
+            Powerlaw() * Gaussian()
+
+
+class TestTabulatedAbsorption(object):
+
+    @classmethod
+    def setup_class(cls):
+        cls.tmpdir = tempfile.mkdtemp()
+
+        # sigma ~ E^-8/3, roughly the shape of the photoabsorption
+        # cross section between the edges
+        cls.energy = np.logspace(-1, 1.5, 50)
+        cls.sigma = 2e-22 * cls.energy**(-8.0/3.0)
+        cls.tablefile = os.path.join(cls.tmpdir, "xsect.txt")
+        np.savetxt(cls.tablefile, np.column_stack([cls.energy, cls.sigma]))
+
+        cls.ener_lo = np.linspace(0.5, 10.0, 200)
+        cls.ener_hi = cls.ener_lo + 0.05
+
+    @classmethod
+    def teardown_class(cls):
+        shutil.rmtree(cls.tmpdir)
+
+    def test_table_is_read_once(self):
+        e1, s1 = load_cross_sections(self.tablefile)
+        e2, s2 = load_cross_sections(self.tablefile)
+        assert e1 is e2 and s1 is s2
+        assert np.allclose(s1, self.sigma)
+
+    def test_absorption_matches_exact_cross_section(self):
+        absorb = TabulatedAbsorption(self.tablefile, nh=0.5)
+        m = absorb.calculate(self.ener_lo, self.ener_hi)
+
+        ener_mid = 0.5 * (self.ener_lo + self.ener_hi)
+        expected = np.exp(-0.5e22 * 2e-22 * ener_mid**(-8.0/3.0))
+        assert np.allclose(m, expected, rtol=1e-10)
+
+    def test_grid_outside_table_fails(self):
+        absorb = TabulatedAbsorption((self.energy, self.sigma))
+        with pytest.raises(ValueError):
+            absorb.bind(self.ener_lo / 10.0, self.ener_hi / 10.0)
+        with pytest.raises(ValueError):
+            absorb.bind(self.ener_lo * 10.0, self.ener_hi * 10.0)
+        with pytest.raises(ValueError):
+            absorb.evaluate()
+
+    def test_batched_column_densities(self):
+        absorb = TabulatedAbsorption((self.energy, self.sigma))
+        absorb.bind(self.ener_lo, self.ener_hi)
+        nh = np.array([[0.0], [0.1], [1.0]])
+        m = absorb.evaluate(nh)
+        assert m.shape == (3, len(self.ener_lo))
+        assert np.all(m[0] == 1.0)
+        assert np.allclose(m[2], m[1]**10)
+
+    def test_absorbed_powerlaw(self):
+        model = TabulatedAbsorption(self.tablefile, nh=0.3) * \
+                Powerlaw(norm=1.0, phoindex=2.0)
+        assert not TabulatedAbsorption(self.tablefile).additive
+        assert model.additive
+        assert model.param_names == ["tabulatedabsorption.nh",
+                                     "powerlaw.norm", "powerlaw.phoindex"]
+
+        m = model.calculate(self.ener_lo, self.ener_hi)
+        expected = TabulatedAbsorption(self.tablefile, nh=0.3).calculate(
+                       self.ener_lo, self.ener_hi) * \
+                   Powerlaw(norm=1.0, phoindex=2.0).calculate(
+                       self.ener_lo, self.ener_hi)
+        assert np.allclose(m, expected)
@@ -0,0 +1,82 @@
+import os
+import shutil
+import tempfile
+
+import pytest
+import numpy as np
+
+from clarsach.spectrum import XSpectrum
+from clarsach.respond import RMF
+from clarsach.models.powerlaw import Powerlaw
+from clarsach import parallel
+from clarsach.tests.conftest import make_fake_pha
+
+pytestmark = pytest.mark.skipif(not parallel.HAS_SHARED_MEMORY,
+                                reason="requires multiprocessing.shared_memory")
+
+
+def _fold_powerlaw(spec):
+    """
+    A stand-in for a fit: fold a power law through the response, and
+    report whether the response arrays are shared.
+    """
+    pl = Powerlaw(norm=1.0, phoindex=2.0)
+    m = pl.calculate(spec.arf.e_low, spec.arf.e_high)
+    shared = not spec.rmf.matrix.flags.owndata and \
+             not spec.rmf.matrix.flags.writeable
+    return np.sum(spec.apply_resp(m)), shared, os.getpid()
+
+
+# the fused responses seen in a worker, kept alive so their ids are unique
+_FUSED_SEEN = []
+
+
+def _fused_response_id(spec):
+    _FUSED_SEEN.append(spec._fused_response())
+    return id(_FUSED_SEEN[-1])
+
+
+class TestFitCatalog(object):
+
+    @classmethod
+    def setup_class(cls):
+        cls.tmpdir = tempfile.mkdtemp()
+        cls.phafile = make_fake_pha(cls.tmpdir)
+
+        cls.spectra = [XSpectrum(cls.phafile, telescope="ACIS")
+                       for i in range(10)]
+
+        spec = cls.spectra[0]
+        pl = Powerlaw(norm=1.0, phoindex=2.0)
+        m = pl.calculate(spec.arf.e_low, spec.arf.e_high)
+        cls.expected = np.sum(spec.apply_resp(m))
+
+    @classmethod
+    def teardown_class(cls):
+        shutil.rmtree(cls.tmpdir)
+
+    def test_all_spectra_are_fit(self):
+        results = dict(parallel.fit_catalog(self.spectra, _fold_powerlaw,
+                                            n_workers=2, chunksize=3))
+        assert sorted(results.keys()) == list(range(len(self.spectra)))
+        for total, shared, pid in results.values():
+            assert np.isclose(total, self.expected)
+            assert shared
+            assert pid != os.getpid()
+
+    def test_fused_response_is_built_once_per_worker(self):
+        results = dict(parallel.fit_catalog(self.spectra, _fused_response_id,
+                                            n_workers=1, chunksize=3))
+        assert len(set(results.values())) == 1
+
+    def test_shared_response_round_trip(self):
+        rmf = RMF("data/PCU2.rsp")
+        shared = parallel.SharedResponse(rmf)
+
+        rmf_s = shared.attach()
+        assert not rmf_s.matrix.flags.writeable
+        m = np.ones(len(rmf.n_grp))
+        assert np.allclose(rmf_s.apply_rmf(m), rmf.apply_rmf(m))
+
+        del rmf_s
+        shared.close()
@@ -0,0 +1,41 @@
+import pytest
+import numpy as np
+
+from clarsach.rebin import rebin_matrix
+
+
+class TestRebinMatrix(object):
+
+    @classmethod
+    def setup_class(cls):
+        cls.dst = np.linspace(1.0, 10.0, 31)
+        cls.dst_lo = cls.dst[:-1]
+        cls.dst_hi = cls.dst[1:]
+
+    def test_same_grid_is_identity(self):
+        rebin = rebin_matrix(self.dst_lo, self.dst_hi,
+                             self.dst_lo, self.dst_hi)
+        assert np.allclose(rebin.toarray(), np.eye(len(self.dst_lo)))
+
+    def test_finer_grid_sums_bins(self):
+        src = np.linspace(1.0, 10.0, 91)
+        flux = np.random.RandomState(20170726).uniform(size=90)
+        rebin = rebin_matrix(src[:-1], src[1:], self.dst_lo, self.dst_hi)
+        assert np.allclose(rebin.T.dot(flux),
+                           flux.reshape(30, 3).sum(axis=1))
+
+    def test_coarse_grid_conserves_flux(self):
+        src = np.linspace(0.5, 11.0, 8)
+        flux = np.arange(1.0, 8.0)
+        rebin = rebin_matrix(src[:-1], src[1:], self.dst_lo, self.dst_hi)
+        out = rebin.T.dot(flux)
+
+        # the parts of the first and last source bins outside the grid
+        # are dropped
+        lost = flux[0] * 0.5 / 1.5 + flux[-1] * 1.0 / 1.5
+        assert np.isclose(out.sum(), flux.sum() - lost)
+
+    def test_mismatched_edges_fail(self):
+        with pytest.raises(ValueError):
+            rebin_matrix(self.dst_lo, self.dst_hi[:-1],
+                         self.dst_lo, self.dst_hi)
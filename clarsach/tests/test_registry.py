@@ -0,0 +1,88 @@
+import os
+import shutil
+import tempfile
+import threading
+
+import pytest
+
+from clarsach.respond import RMF
+from clarsach.registry import ResponseRegistry, registry
+
+
+class TestResponseRegistry(object):
+
+    @classmethod
+    def setup_class(cls):
+        cls.filename = "data/PCU2.rsp"
+
+        cls.tmpdir = tempfile.mkdtemp()
+        cls.filename2 = os.path.join(cls.tmpdir, "copy.rsp")
+        shutil.copy(cls.filename, cls.filename2)
+
+    @classmethod
+    def teardown_class(cls):
+        shutil.rmtree(cls.tmpdir)
+
+    def test_identical_files_share_an_instance(self):
+        reg = ResponseRegistry()
+        rmf1 = reg.get(RMF, self.filename)
+        rmf2 = reg.get(RMF, self.filename)
+
+        assert rmf1 is rmf2
+        assert len(reg) == 1
+
+    def test_different_files_get_different_instances(self):
+        reg = ResponseRegistry()
+        rmf1 = reg.get(RMF, self.filename)
+        rmf2 = reg.get(RMF, self.filename2)
+
+        assert rmf1 is not rmf2
+
+    def test_shared_instances_are_read_only(self):
+        reg = ResponseRegistry()
+        rmf = reg.get(RMF, self.filename)
+
+        with pytest.raises(ValueError):
+            rmf.matrix[0] = 1.0
+
+    def test_least_recently_used_entry_is_evicted(self):
+        reg = ResponseRegistry()
+        rmf1 = reg.get(RMF, self.filename)
+
+        reg.max_bytes = reg.nbytes
+        reg.get(RMF, self.filename2)
+
+        assert len(reg) == 1
+        assert reg.get(RMF, self.filename) is not rmf1
+
+    def test_different_files_are_loaded_concurrently(self):
+        # both loads must be inside the constructor at the same time
+        entered = [threading.Event(), threading.Event()]
+        overlapped = []
+
+        class SlowRMF(RMF):
+            def __init__(self, filename, index):
+                entered[index].set()
+                overlapped.append(entered[1 - index].wait(10))
+                RMF.__init__(self, filename)
+
+        reg = ResponseRegistry()
+        threads = [threading.Thread(target=reg.get, args=(SlowRMF, f),
+                                    kwargs={"index": i})
+                   for i, f in enumerate([self.filename, self.filename2])]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert overlapped == [True, True]
+        assert len(reg) == 2
+
+    def test_rmf_load_uses_process_registry(self):
+        registry.clear()
+        rmf1 = RMF.load(self.filename)
+        rmf2 = RMF.load(self.filename)
+
+        assert rmf1 is rmf2
+        assert len(registry) == 1
+        registry.clear()
@@ -1,9 +1,15 @@
+import os
+import shutil
+import tempfile
+
 import pytest
 import numpy as np
 
 import astropy.io.fits as fits
 
+from clarsach import _kernels, respond
 from clarsach.respond import ARF, RMF
+from clarsach.models.powerlaw import Powerlaw
 
 class TestRMF(object):
 
@@ -45,3 +51,269 @@ class TestRMF(object):
 
     def test_n_chan_has_no_zeros(self):
         assert np.all(self.rmf.n_chan > 0)
+
+    def test_sparse_matrix_has_correct_shape(self):
+        assert self.rmf.sparse_matrix.shape == (len(self.rmf.energ_lo),
+                                                self.rmf.detchans)
+
+    def test_sparse_fold_matches_loop(self):
+        pl = Powerlaw(norm=1.0, phoindex=2.0)
+        m = pl.calculate(ener_lo=self.rmf.energ_lo, ener_hi=self.rmf.energ_hi)
+
+        m_sparse = self.rmf.apply_rmf(m)
+        m_loop = self.rmf._apply_rmf_loop(m)
+
+        assert np.allclose(m_sparse, m_loop)
+
+    def test_batched_fold_matches_single_folds(self):
+        pl = Powerlaw(norm=1.0, phoindex=2.0)
+        m = pl.calculate(ener_lo=self.rmf.energ_lo, ener_hi=self.rmf.energ_hi)
+        m_batch = np.outer(np.linspace(0.5, 2.0, 5), m)
+
+        c_batch = self.rmf.apply_rmf(m_batch)
+
+        assert c_batch.shape == (5, self.rmf.detchans)
+        for mm, cc in zip(m_batch, c_batch):
+            assert np.allclose(self.rmf.apply_rmf(mm), cc)
+
+    @pytest.mark.parametrize("backend", ["python", "numba"])
+    def test_backends_match_sparse_fold(self, backend):
+        if backend == "numba":
+            pytest.importorskip("numba")
+
+        m = np.outer(np.linspace(0.5, 2.0, 3),
+                     np.linspace(1.0, 2.0, len(self.rmf.energ_lo)))
+        rmf = RMF(self.filename, backend=backend)
+
+        assert rmf.backend == backend
+        assert np.allclose(rmf.apply_rmf(m), self.rmf.apply_rmf(m))
+        assert np.allclose(rmf.apply_rmf(m[0]), self.rmf.apply_rmf(m[0]))
+
+    @pytest.mark.parametrize("backend", ["numpy-sparse", "numba"])
+    def test_threaded_fold_matches_single_thread(self, backend):
+        if backend == "numba":
+            pytest.importorskip("numba")
+
+        m = np.outer(np.linspace(0.5, 2.0, 3),
+                     np.linspace(1.0, 2.0, len(self.rmf.energ_lo)))
+        rmf = RMF(self.filename, backend=backend, n_threads=3)
+
+        assert np.allclose(rmf.apply_rmf(m), self.rmf.apply_rmf(m))
+        assert np.allclose(rmf.apply_rmf(m[0]), self.rmf.apply_rmf(m[0]))
+        assert np.all(rmf.apply_rmf(m) == rmf.apply_rmf(m))
+
+    @pytest.mark.parametrize(("backend", "n_threads"),
+                             [("numpy-sparse", 1), ("numpy-sparse", 3),
+                              ("numba", 1), ("numba", 3)])
+    def test_transpose_is_adjoint_of_fold(self, backend, n_threads):
+        if backend == "numba":
+            pytest.importorskip("numba")
+
+        rng = np.random.RandomState(20170726)
+        m = rng.uniform(size=(3, len(self.rmf.energ_lo)))
+        c = rng.uniform(size=(3, self.rmf.detchans))
+        rmf = RMF(self.filename, backend=backend, n_threads=n_threads)
+
+        c_t = rmf.apply_rmf_transpose(c)
+
+        assert c_t.shape == m.shape
+        assert np.allclose(np.sum(m * c_t, axis=1),
+                           np.sum(rmf.apply_rmf(m) * c, axis=1))
+        assert np.allclose(rmf.apply_rmf_transpose(c[0]), c_t[0])
+
+    def test_numba_backend_builds_sparse_matrix_on_first_use(self):
+        pytest.importorskip("numba")
+
+        rmf = RMF(self.filename, backend="numba")
+        assert rmf._sparse_matrix is None
+
+        m = np.ones(len(rmf.energ_lo))
+        rmf.apply_rmf(m)
+        assert rmf._sparse_matrix is None
+
+        assert np.allclose(rmf.sparse_matrix.T.dot(m), rmf.apply_rmf(m))
+
+    def test_unknown_backend_fails(self):
+        with pytest.raises(ValueError):
+            RMF(self.filename, backend="fortran")
+
+    def test_numba_backend_falls_back_without_numba(self, monkeypatch):
+        monkeypatch.setattr(_kernels, "HAS_NUMBA", False)
+
+        with pytest.warns(UserWarning):
+            rmf = RMF(self.filename, backend="numba")
+
+        assert rmf.backend == "numpy-sparse"
+
+
+def make_vla_rmf(filename, n_energy=50, detchans=40, seed=20170726):
+    """
+    Write a small RMF with variable-length `F_CHAN`, `N_CHAN` and
+    `MATRIX` columns, including energy bins without any channel groups.
+    """
+    rng = np.random.RandomState(seed)
+    n_grp = rng.randint(0, 3, size=n_energy)
+
+    f_chan, n_chan, matrix = [], [], []
+    for n in n_grp:
+        f = np.sort(rng.choice(np.arange(1, detchans - 5, 6), size=n,
+                               replace=False))
+        nc = rng.randint(1, 5, size=n)
+        f_chan.append(f.astype(np.int16))
+        n_chan.append(nc.astype(np.int16))
+        matrix.append(rng.rand(np.sum(nc)).astype(np.float32))
+
+    energ = np.linspace(1.0, 10.0, n_energy + 1)
+    hdu = fits.BinTableHDU.from_columns(
+        [fits.Column(name="ENERG_LO", format="E", unit="keV", array=energ[:-1]),
+         fits.Column(name="ENERG_HI", format="E", unit="keV", array=energ[1:]),
+         fits.Column(name="N_GRP", format="I", array=n_grp),
+         fits.Column(name="F_CHAN", format="PI()",
+                     array=np.array(f_chan, dtype=object)),
+         fits.Column(name="N_CHAN", format="PI()",
+                     array=np.array(n_chan, dtype=object)),
+         fits.Column(name="MATRIX", format="PE()",
+                     array=np.array(matrix, dtype=object))],
+        name="MATRIX")
+    hdu.header["DETCHANS"] = detchans
+    hdu.header["TLMIN4"] = 1
+    hdu.writeto(filename)
+
+    return filename
+
+
+class TestVariableLengthRMF(object):
+
+    @classmethod
+    def setup_class(cls):
+        cls.tmpdir = tempfile.mkdtemp()
+        cls.filename = make_vla_rmf(os.path.join(cls.tmpdir, "vla.rmf"))
+        cls.rmf = RMF(cls.filename)
+
+    @classmethod
+    def teardown_class(cls):
+        shutil.rmtree(cls.tmpdir)
+
+    def test_heap_loader_matches_row_by_row_flattening(self):
+        h = fits.open(self.filename)
+        data = h["MATRIX"].data
+        n_grp, f_chan, n_chan, matrix = \
+            self.rmf._flatten_arrays(np.array(data.field("N_GRP")),
+                                     np.array(data.field("F_CHAN")),
+                                     np.array(data.field("N_CHAN")),
+                                     np.array(data.field("MATRIX")))
+        h.close()
+
+        assert np.all(n_grp == self.rmf.n_grp)
+        assert np.all(f_chan == self.rmf.f_chan)
+        assert np.all(n_chan == self.rmf.n_chan)
+        assert np.all(matrix == self.rmf.matrix)
+
+    def test_heap_is_memory_mapped(self):
+        h = fits.open(self.filename)
+        heap = self.rmf._RMF__get_heap(self.filename, h["MATRIX"])
+        h.close()
+
+        assert heap is not None
+        assert heap.size == h["MATRIX"].header["PCOUNT"]
+
+    def test_sparse_fold_matches_loop(self):
+        m = np.linspace(1.0, 2.0, len(self.rmf.energ_lo))
+
+        assert np.allclose(self.rmf.apply_rmf(m),
+                           self.rmf._apply_rmf_loop(m))
+
+
+class TestChunkedRMF(object):
+
+    @classmethod
+    def setup_class(cls):
+        cls.tmpdir = tempfile.mkdtemp()
+        cls.filenames = ["data/PCU2.rsp",
+                         make_vla_rmf(os.path.join(cls.tmpdir, "vla.rmf"))]
+
+    @classmethod
+    def teardown_class(cls):
+        shutil.rmtree(cls.tmpdir)
+
+    @pytest.mark.parametrize("chunk_rows", [1, 7, 64, 10000])
+    def test_chunked_loader_matches_full_loader(self, chunk_rows):
+        for filename in self.filenames:
+            rmf = RMF(filename)
+            rmf_c = RMF(filename, chunk_rows=chunk_rows)
+
+            for name in ["n_grp", "f_chan", "n_chan", "matrix"]:
+                assert np.all(getattr(rmf_c, name) == getattr(rmf, name))
+
+            diff = rmf_c.sparse_matrix - rmf.sparse_matrix
+            assert rmf_c.sparse_matrix.shape == rmf.sparse_matrix.shape
+            assert rmf_c.sparse_matrix.nnz == rmf.sparse_matrix.nnz
+            assert np.allclose(diff.toarray(), 0)
+
+    def test_streaming_fold_matches_apply_rmf(self):
+        for filename in self.filenames:
+            rmf = RMF(filename)
+            m = np.vstack([np.linspace(1.0, 2.0, len(rmf.energ_lo)),
+                           np.linspace(2.0, 1.0, len(rmf.energ_lo))])
+
+            counts = RMF.fold_streaming(filename, m, chunk_rows=13)
+            assert np.allclose(counts, rmf.apply_rmf(m))
+            assert np.allclose(RMF.fold_streaming(filename, m[0]),
+                               rmf.apply_rmf(m[0]))
+
+    def test_chunked_compact_loader_matches_compact_loader(self):
+        for filename in self.filenames:
+            rmf = RMF(filename, compact=True)
+            rmf_c = RMF(filename, compact=True, chunk_rows=7)
+
+            assert rmf_c.matrix.dtype == np.float32
+            assert rmf_c.sparse_matrix.dtype == np.float32
+            assert np.all(rmf_c.matrix == rmf.matrix)
+            assert np.all(rmf_c.sparse_matrix.data == rmf.sparse_matrix.data)
+
+    def test_streaming_fold_of_wrong_length_fails(self):
+        rmf = RMF(self.filenames[0])
+        m = np.ones(len(rmf.energ_lo) - 1)
+
+        with pytest.raises(ValueError):
+            RMF.fold_streaming(self.filenames[0], m)
+
+
+class TestCompactRMF(object):
+
+    @classmethod
+    def setup_class(cls):
+        cls.rmf = RMF("data/PCU2.rsp")
+        cls.rmf_c = RMF("data/PCU2.rsp", compact=True)
+
+        pl = Powerlaw(norm=1.0, phoindex=2.0)
+        cls.m = np.array(pl.calculate(ener_lo=cls.rmf.energ_lo,
+                                      ener_hi=cls.rmf.energ_hi))
+
+    def test_compact_dtypes(self):
+        assert self.rmf_c.matrix.dtype == np.float32
+        assert self.rmf_c.sparse_matrix.dtype == np.float32
+        for name in ["n_grp", "f_chan", "n_chan"]:
+            assert getattr(self.rmf_c, name).dtype.itemsize <= 2
+        assert self.rmf_c.sparse_matrix.nnz == self.rmf.sparse_matrix.nnz
+
+    @pytest.mark.parametrize("backend", ["numpy-sparse", "python", "numba"])
+    def test_compact_fold_is_accurate(self, backend):
+        self.rmf_c.backend = backend
+        counts = self.rmf_c.apply_rmf(self.m)
+        assert counts.dtype == np.float64
+        assert np.allclose(counts, self.rmf.apply_rmf(self.m),
+                           rtol=1e-6, atol=0)
+        self.rmf_c.backend = None
+
+    def test_compact_fold_in_blocks(self, monkeypatch):
+        monkeypatch.setattr(respond, "DEFAULT_CHUNK_ROWS", 7)
+
+        m2 = np.vstack([self.m, 2 * self.m])
+        assert np.allclose(self.rmf_c.apply_rmf(m2), self.rmf.apply_rmf(m2),
+                           rtol=1e-6, atol=0)
+
+        counts = np.linspace(1.0, 2.0, self.rmf.detchans)
+        assert np.allclose(self.rmf_c.apply_rmf_transpose(counts),
+                           self.rmf.apply_rmf_transpose(counts),
+                           rtol=1e-6, atol=0)
@@ -97,6 +97,13 @@ class TestRXTEPCAIntegration(object):
 
         assert np.allclose(self.sherpa_rmf, m_rmf_c)
 
+    def test_clarsach_rmf_compact(self):
+        rmf_c = RMF(self.rmffile, compact=True)
+
+        m_rmf_c = rmf_c.apply_rmf(self.m)
+
+        assert np.allclose(self.sherpa_rmf, m_rmf_c)
+
 
 class TestRXTEHEXTEIntegration(object):
 
@@ -1,9 +1,494 @@
+import gc
+import os
+import shutil
+import tempfile
+import weakref
+
 import pytest
-from clarsach.spectrum import XSpectrum
+import numpy as np
+
+import astropy.io.fits as fits
+
+from clarsach import spectrum
+from clarsach.spectrum import XSpectrum, PHAII, CONST_HC
+from clarsach.respond import ARF, RMF
+from clarsach.models.powerlaw import Powerlaw
+from clarsach.tests.conftest import make_fake_pha
 
 @pytest.mark.parametrize(('ttype','filename'),
                         [('HETG',"data/fake_heg_p1.pha"),
                          ('ACIS',"data/fake_acis.pha")])
 def test_load_xspectrum(ttype, filename):
     test = XSpectrum(filename, telescope=ttype)
-    assert isinstance(test, XSpectrum)
\ No newline at end of file
+    assert isinstance(test, XSpectrum)
+
+
+class TestXSpectrumResponse(object):
+
+    @classmethod
+    def setup_class(cls):
+        cls.tmpdir = tempfile.mkdtemp()
+        cls.phafile = make_fake_pha(cls.tmpdir)
+
+        cls.spec = XSpectrum(cls.phafile, telescope="ACIS")
+
+        pl = Powerlaw(norm=1.0, phoindex=2.0)
+        cls.m = pl.calculate(ener_lo=cls.spec.arf.e_low,
+                             ener_hi=cls.spec.arf.e_high)
+
+    @classmethod
+    def teardown_class(cls):
+        shutil.rmtree(cls.tmpdir)
+
+    def test_apply_resp_matches_arf_then_rmf(self):
+        m_arf = self.spec.arf.apply_arf(self.m)
+        m_rmf = self.spec.rmf.apply_rmf(m_arf)
+
+        assert np.allclose(self.spec.apply_resp(self.m), m_rmf)
+
+    def test_exposure_override_recomputes_response(self):
+        c_default = self.spec.apply_resp(self.m)
+        c_short = self.spec.apply_resp(self.m, exposure=1.0)
+
+        assert np.allclose(c_default, c_short * self.spec.arf.exposure)
+        assert np.allclose(self.spec.apply_resp(self.m), c_default)
+
+    def test_fused_response_is_cached(self):
+        resp1 = self.spec._fused_response()
+        resp2 = self.spec._fused_response()
+
+        assert resp1 is resp2
+
+    def test_fused_response_is_shared_between_spectra(self):
+        spec = XSpectrum(self.phafile, telescope="ACIS")
+        assert spec._fused_response() is self.spec._fused_response()
+
+        spec.notice(5.0, 20.0)
+        assert spec._fused_response() is not self.spec._fused_response()
+
+        spec2 = XSpectrum(self.phafile, telescope="ACIS")
+        spec2.notice(5.0, 20.0)
+        assert spec2._fused_response() is spec._fused_response()
+
+    def test_fused_responses_are_dropped_with_the_responses(self):
+        spec = XSpectrum(self.phafile, telescope="ACIS")
+        spec.rmf = RMF(spec.rmf_file)
+        spec.arf = ARF(spec.arf_file)
+        spec.apply_resp(self.m)
+
+        assert spec.rmf in spectrum._FUSED_RESPONSES
+        refs = [weakref.ref(spec.rmf), weakref.ref(spec.arf)]
+
+        del spec
+        gc.collect()
+
+        assert all(r() is None for r in refs)
+
+    def test_model_on_finer_grid(self):
+        spec = XSpectrum(self.phafile, telescope="ACIS")
+        e_low = np.asarray(spec.arf.e_low, dtype=np.float64)
+        e_high = np.asarray(spec.arf.e_high, dtype=np.float64)
+        e_mid = 0.5 * (e_low + e_high)
+        fine_lo = np.column_stack([e_low, e_mid]).ravel()
+        fine_hi = np.column_stack([e_mid, e_high]).ravel()
+
+        pl = Powerlaw(norm=1.0, phoindex=2.0)
+        m_fine = pl.calculate(fine_lo, fine_hi)
+
+        spec.set_model_grid(fine_lo, fine_hi)
+        assert spec._fused_response().shape[0] == len(fine_lo)
+        counts = spec.apply_resp(m_fine)
+
+        spec.set_model_grid()
+        expected = spec.apply_resp(m_fine.reshape(-1, 2).sum(axis=1))
+        assert np.allclose(counts, expected)
+
+    def test_low_rank_response(self):
+        lr = self.spec.low_rank_response(tol=1e-4)
+        assert lr.shape == self.spec._fused_response().shape
+        assert lr.residual(self.m) < 1e-3
+        exact = self.spec.apply_resp(self.m)
+        assert np.allclose(lr.apply(self.m), exact,
+                           rtol=0, atol=1e-3 * np.max(exact))
+
+    @pytest.mark.parametrize(("backend", "n_threads"),
+                             [("python", 1), ("numba", 1),
+                              ("numpy-sparse", 2)])
+    def test_apply_resp_uses_rmf_backend(self, backend, n_threads):
+        if backend == "numba":
+            pytest.importorskip("numba")
+
+        rmf = RMF(self.spec.rmf_file, backend=backend, n_threads=n_threads)
+        spec = XSpectrum.from_arrays(self.spec.bin_lo, self.spec.bin_hi,
+                                     self.spec.bin_unit, self.spec.counts,
+                                     rmf=rmf, arf=self.spec.arf)
+        spec.group_bins(4)
+        spec.notice(5.0, 20.0)
+        self.spec.group_bins(4)
+        self.spec.notice(5.0, 20.0)
+
+        try:
+            assert spec._use_rmf_backend()
+            c = spec.apply_resp(self.m)
+            assert spec._resp_cache is None
+            assert np.allclose(c, self.spec.apply_resp(self.m))
+
+            c_t = spec.apply_resp_adjoint(np.ones_like(c))
+            assert np.allclose(c_t,
+                               self.spec.apply_resp_adjoint(np.ones_like(c)))
+        finally:
+            self.spec.notice_all()
+            self.spec.ungroup()
+
+    def test_apply_resp_adjoint_is_transpose(self):
+        rng = np.random.RandomState(20170726)
+        c = rng.uniform(size=len(self.spec.counts))
+
+        c_t = self.spec.apply_resp_adjoint(c)
+
+        assert np.isclose(np.sum(self.m * c_t),
+                          np.sum(self.spec.apply_resp(self.m) * c))
+
+
+class TestXSpectrumLazyResponse(object):
+
+    @classmethod
+    def setup_class(cls):
+        cls.tmpdir = tempfile.mkdtemp()
+        cls.phafile = make_fake_pha(cls.tmpdir)
+
+    @classmethod
+    def teardown_class(cls):
+        shutil.rmtree(cls.tmpdir)
+
+    def test_responses_are_not_read_on_init(self):
+        spec = XSpectrum(self.phafile, telescope="ACIS")
+        assert spec._rmf is None
+        assert spec._arf is None
+
+    def test_responses_are_read_on_first_use(self):
+        spec = XSpectrum(self.phafile, telescope="ACIS")
+        assert isinstance(spec.arf, ARF)
+        assert isinstance(spec.rmf, RMF)
+        assert spec.rmf is spec._rmf
+
+    def test_preload_reads_responses(self):
+        spec = XSpectrum(self.phafile, telescope="ACIS")
+        spec.preload()
+        assert spec._rmf is not None
+        assert spec._arf is not None
+
+    def test_no_response_file_gives_none(self):
+        spec = XSpectrum.from_arrays(np.arange(3.0), np.arange(1.0, 4.0),
+                                     "keV", np.ones(3))
+        assert spec.rmf is None
+        assert spec.arf is None
+
+    def test_no_unit_warning_after_changing_units(self, capsys):
+        spec = XSpectrum(self.phafile, telescope="ACIS")
+        spec.hard_set_units("angs")
+        capsys.readouterr()
+
+        spec.preload()
+
+        assert "units are not the same" not in capsys.readouterr().out
+
+
+class TestXSpectrumUnitViews(object):
+
+    @classmethod
+    def setup_class(cls):
+        cls.tmpdir = tempfile.mkdtemp()
+        cls.phafile = make_fake_pha(cls.tmpdir)
+
+    @classmethod
+    def teardown_class(cls):
+        shutil.rmtree(cls.tmpdir)
+
+    def setup_method(self, method):
+        self.spec = XSpectrum(self.phafile, telescope="ACIS")
+
+    def test_views_are_cached_and_read_only(self):
+        views = self.spec._change_units("angs")
+        assert self.spec._change_units("angs") is views
+        for v in views:
+            assert not v.flags.writeable
+            with pytest.raises(ValueError):
+                v[0] = 0
+
+    def test_wavelength_views_match_conversion(self):
+        lo, hi, mid, cts = self.spec._change_units("angs")
+        assert np.allclose(lo, CONST_HC / self.spec.bin_hi[::-1])
+        assert np.allclose(hi, CONST_HC / self.spec.bin_lo[::-1])
+        assert np.allclose(mid, 0.5 * (lo + hi))
+        assert np.all(cts == self.spec.counts[::-1])
+
+    def test_hard_set_units_invalidates_views(self):
+        lo_kev = np.array(self.spec.bin_lo)
+        self.spec._change_units("keV")
+        self.spec.hard_set_units("angs")
+        assert self.spec.bin_unit == "angs"
+        assert self.spec.is_monotonically_increasing
+
+        lo, hi, mid, cts = self.spec._change_units("keV")
+        assert np.allclose(lo, lo_kev)
+        assert np.all(self.spec.bin_mid == self.spec._change_units("angs")[2])
+
+
+class TestXSpectrumNotice(object):
+
+    @classmethod
+    def setup_class(cls):
+        cls.tmpdir = tempfile.mkdtemp()
+        cls.phafile = make_fake_pha(cls.tmpdir)
+
+        pl = Powerlaw(norm=1.0, phoindex=2.0)
+        spec = XSpectrum(cls.phafile, telescope="ACIS")
+        cls.m = pl.calculate(ener_lo=spec.arf.e_low, ener_hi=spec.arf.e_high)
+        cls.c_full = spec.apply_resp(cls.m)
+
+    @classmethod
+    def teardown_class(cls):
+        shutil.rmtree(cls.tmpdir)
+
+    def setup_method(self, method):
+        self.spec = XSpectrum(self.phafile, telescope="ACIS")
+
+    def test_notice_selects_overlapping_channels(self):
+        self.spec.notice(5.0, 20.0)
+
+        mask = (self.spec.bin_hi > 5.0) & (self.spec.bin_lo < 20.0)
+        assert np.all(self.spec.channel_mask == mask)
+
+    def test_ignore_removes_channels(self):
+        self.spec.notice(5.0, 20.0)
+        self.spec.ignore(8.0, 9.0)
+
+        mask = (self.spec.bin_hi > 5.0) & (self.spec.bin_lo < 20.0) & \
+               ~((self.spec.bin_hi > 8.0) & (self.spec.bin_lo < 9.0))
+        assert np.all(self.spec.channel_mask == mask)
+
+    def test_notice_in_wavelength(self):
+        self.spec.notice(12.398418573430595 / 20.0, 12.398418573430595 / 5.0,
+                         unit="angs")
+
+        mask = (self.spec.bin_hi > 5.0) & (self.spec.bin_lo < 20.0)
+        assert np.all(self.spec.channel_mask == mask)
+
+    def test_folded_model_has_noticed_channels_only(self):
+        self.spec.notice(5.0, 20.0)
+
+        c = self.spec.apply_resp(self.m)
+
+        assert np.allclose(c, self.c_full[self.spec.channel_mask])
+        assert len(self.spec.noticed_counts) == len(c)
+
+    def test_noticed_counts_keep_response_order(self):
+        self.spec.notice(5.0, 20.0)
+        counts = self.spec.noticed_counts
+
+        self.spec.notice_all()
+        self.spec.hard_set_units("angs")
+        self.spec.notice(5.0, 20.0)
+
+        assert np.all(self.spec.noticed_counts == counts)
+        assert len(self.spec.noticed_counts) == \
+               len(self.spec.apply_resp(self.m))
+
+    def test_pruned_model_gives_same_result(self):
+        self.spec.notice(5.0, 20.0)
+
+        mask = self.spec.energy_mask
+
+        assert np.sum(mask) < len(self.m)
+        assert np.allclose(self.spec.apply_resp(self.m[mask], pruned=True),
+                           self.spec.apply_resp(self.m))
+
+    def test_model_of_wrong_length_fails(self):
+        self.spec.notice(5.0, 20.0)
+
+        with pytest.raises(ValueError):
+            self.spec.apply_resp(self.m[self.spec.energy_mask])
+        with pytest.raises(ValueError):
+            self.spec.apply_resp(self.m, pruned=True)
+
+    def test_notice_all_resets_filter(self):
+        self.spec.notice(5.0, 20.0)
+        self.spec.notice_all()
+
+        assert np.allclose(self.spec.apply_resp(self.m), self.c_full)
+
+
+class TestXSpectrumGrouping(object):
+
+    @classmethod
+    def setup_class(cls):
+        cls.tmpdir = tempfile.mkdtemp()
+        cls.phafile = make_fake_pha(cls.tmpdir)
+
+        pl = Powerlaw(norm=1.0, phoindex=2.0)
+        spec = XSpectrum(cls.phafile, telescope="ACIS")
+        cls.m = pl.calculate(ener_lo=spec.arf.e_low, ener_hi=spec.arf.e_high)
+        cls.c_full = spec.apply_resp(cls.m)
+
+    @classmethod
+    def teardown_class(cls):
+        shutil.rmtree(cls.tmpdir)
+
+    def setup_method(self, method):
+        self.spec = XSpectrum(self.phafile, telescope="ACIS")
+
+    def test_group_counts_has_minimum_counts(self):
+        self.spec.group_counts(200)
+
+        counts = self.spec.noticed_counts
+
+        assert np.all(counts[:-1] >= 200)
+        assert np.sum(counts) == np.sum(self.spec.counts)
+
+    def test_group_counts_in_response_order(self):
+        self.spec.group_counts(200)
+        group_ids = self.spec.group_ids
+        counts = self.spec.noticed_counts
+
+        self.spec.hard_set_units("angs")
+        self.spec.group_counts(200)
+
+        assert np.all(self.spec.group_ids == group_ids)
+        assert np.all(self.spec.noticed_counts == counts)
+
+    def test_group_snr_is_group_counts(self):
+        self.spec.group_snr(10.0)
+        group_ids = self.spec.group_ids
+
+        self.spec.group_counts(100)
+
+        assert np.all(group_ids == self.spec.group_ids)
+
+    def test_grouped_model_sums_channels(self):
+        self.spec.group_bins(4)
+
+        c = self.spec.apply_resp(self.m)
+
+        assert np.allclose(c, self.c_full.reshape(-1, 4).sum(axis=1))
+
+    def test_grouping_with_noticed_channels(self):
+        self.spec.group_bins(4)
+        self.spec.notice(5.0, 20.0)
+
+        c = self.spec.apply_resp(self.m)
+        mask = self.spec.channel_mask
+        group_ids = self.spec.group_ids[mask]
+
+        c_test = [np.sum(self.c_full[mask][group_ids == g])
+                  for g in np.unique(group_ids)]
+
+        assert np.allclose(c, c_test)
+        assert len(self.spec.noticed_counts) == len(c)
+
+    def test_group_operator_is_built_once(self):
+        self.spec.group_bins(4)
+        op = self.spec._group_operator()
+        self.spec.noticed_counts
+        assert self.spec._group_operator() is op
+
+        self.spec.notice(5.0, 20.0)
+        assert self.spec._group_operator() is not op
+        assert self.spec._group_operator().shape[1] == \
+               np.sum(self.spec.channel_mask)
+
+    def test_ungroup_restores_channels(self):
+        self.spec.group_bins(4)
+        self.spec.ungroup()
+
+        assert np.allclose(self.spec.apply_resp(self.m), self.c_full)
+
+    def test_group_pha_fails_without_grouping_column(self):
+        with pytest.raises(ValueError):
+            self.spec.group_pha()
+
+    def test_group_pha_uses_grouping_column(self):
+        grouping = np.ones(len(self.spec.counts), dtype=np.int16)
+        grouping[1::2] = -1
+        self.spec.grouping = grouping
+
+        self.spec.group_pha()
+
+        assert np.all(self.spec.group_ids ==
+                      np.arange(len(self.spec.counts)) // 2)
+
+
+def make_fake_pha2(phafile, n_spec=4):
+    """
+    Write a fake PHA type II file with `n_spec` spectra next to the fake
+    PHA file `phafile`, that all use the responses of `phafile`.
+    """
+    ff = fits.open(phafile)
+    data = ff[1].data
+    n_chan = len(data)
+
+    rng = np.random.RandomState(20170726)
+    counts = rng.poisson(50, size=(n_spec, n_chan))
+    bin_lo = np.tile(data["BIN_LO"], (n_spec, 1))
+    bin_hi = np.tile(data["BIN_HI"], (n_spec, 1))
+    ff.close()
+
+    fmt = "%dE" % n_chan
+    hdu = fits.BinTableHDU.from_columns(
+        [fits.Column(name="SPEC_NUM", format="I",
+                     array=np.arange(n_spec) + 1),
+         fits.Column(name="TG_M", format="I",
+                     array=np.array([-1, 1] * (n_spec // 2))),
+         fits.Column(name="BIN_LO", format=fmt, unit="keV", array=bin_lo),
+         fits.Column(name="BIN_HI", format=fmt, unit="keV", array=bin_hi),
+         fits.Column(name="COUNTS", format="%dJ" % n_chan, array=counts)],
+        name="SPECTRUM")
+    hdu.header["RESPFILE"] = "PCU2.rsp"
+    hdu.header["ANCRFILE"] = "fake.arf"
+    hdu.header["EXPOSURE"] = 1e4
+    pha2file = os.path.join(os.path.dirname(phafile), "fake.pha2")
+    hdu.writeto(pha2file)
+
+    return pha2file
+
+
+class TestPHAII(object):
+
+    @classmethod
+    def setup_class(cls):
+        cls.tmpdir = tempfile.mkdtemp()
+        cls.phafile = make_fake_pha(cls.tmpdir)
+        cls.pha2file = make_fake_pha2(cls.phafile)
+        cls.pha2 = PHAII(cls.pha2file)
+
+    @classmethod
+    def teardown_class(cls):
+        shutil.rmtree(cls.tmpdir)
+
+    def test_all_spectra_are_read(self):
+        assert len(self.pha2) == 4
+        assert self.pha2.counts.shape == (4, 64)
+        assert np.all(self.pha2.columns["TG_M"] == [-1, 1, -1, 1])
+
+    def test_spectra_share_arrays(self):
+        for i, spec in enumerate(self.pha2):
+            assert np.shares_memory(spec.counts, self.pha2.counts)
+            assert np.all(spec.counts == self.pha2.counts[i])
+
+    def test_spectra_share_responses(self):
+        assert self.pha2[0].rmf is self.pha2[3].rmf
+        assert self.pha2[0].arf is self.pha2[3].arf
+
+    def test_spectra_are_created_once(self):
+        assert self.pha2[1] is self.pha2[1]
+        assert self.pha2[-1] is self.pha2[3]
+
+    def test_folded_model_matches_type_i_spectrum(self):
+        spec = XSpectrum(self.phafile, telescope="ACIS")
+        m = np.linspace(1.0, 2.0, len(spec.arf.e_low))
+
+        assert np.allclose(self.pha2[2].apply_resp(m), spec.apply_resp(m))
+
+    def test_wrong_number_of_response_files_fails(self):
+        with pytest.raises(ValueError):
+            PHAII(self.pha2file, rmf_files=["PCU2.rsp"] * 3)
@@ -0,0 +1,95 @@
+import pytest
+import numpy as np
+
+import scipy.stats
+import scipy.optimize
+import scipy.special
+
+from clarsach import stats
+
+
+class TestStatistics(object):
+
+    @classmethod
+    def setup_class(cls):
+        rng = np.random.RandomState(20170726)
+        cls.n = 30
+        cls.model = rng.uniform(0.1, 10.0, size=cls.n)
+        cls.counts = rng.poisson(cls.model).astype(np.float64)
+        cls.counts[:3] = 0
+
+        cls.bkg_counts = rng.poisson(2.0, size=cls.n).astype(np.float64)
+        cls.bkg_counts[3:6] = 0
+        cls.alpha = 0.4
+
+    def _numerical_grad(self, func, *args):
+        eps = 1e-6
+        grad = np.zeros(self.n)
+        for i in range(self.n):
+            dm = np.zeros(self.n)
+            dm[i] = eps
+            grad[i] = (func(self.counts, self.model + dm, *args) -
+                       func(self.counts, self.model - dm, *args)) / (2 * eps)
+        return grad
+
+    def test_poisson_loglike_matches_scipy(self):
+        loglike = np.sum(scipy.stats.poisson.logpmf(self.counts, self.model))
+        assert np.isclose(stats.poisson_loglike(self.counts, self.model),
+                          loglike)
+
+    def test_cstat_differs_from_cash_by_data_term(self):
+        diff = stats.cash(self.counts, self.model) - \
+               stats.cstat(self.counts, self.model)
+        diff_test = 2.0 * np.sum(self.counts -
+                                 scipy.special.xlogy(self.counts, self.counts))
+        assert np.isclose(diff, diff_test)
+
+    def test_cstat_is_zero_for_perfect_model(self):
+        counts = self.counts[3:]
+        assert np.isclose(stats.cstat(counts, counts), 0.0)
+
+    def test_wstat_matches_profiled_likelihood(self):
+        tb = 1.0 / self.alpha
+        xlogy = scipy.special.xlogy
+
+        w = 0.0
+        for d, b, m in zip(self.counts, self.bkg_counts, self.model):
+            def neg_loglike(log_f):
+                f = np.exp(log_f)
+                return m + f - xlogy(d, m + f) + tb * f - xlogy(b, tb * f)
+            res = scipy.optimize.minimize_scalar(neg_loglike,
+                                                 bounds=(-40, 10),
+                                                 method="bounded",
+                                                 options={"xatol": 1e-12})
+            w += 2.0 * (res.fun - d + xlogy(d, d) - b + xlogy(b, b))
+
+        assert np.isclose(stats.wstat(self.counts, self.model,
+                                      self.bkg_counts, self.alpha), w)
+
+    @pytest.mark.parametrize(("name", "args"),
+                             [("poisson_loglike", ()),
+                              ("cash", ()),
+                              ("cstat", ()),
+                              ("chi2", ()),
+                              ("wstat", "bkg")])
+    def test_gradients_match_finite_differences(self, name, args):
+        if args == "bkg":
+            args = (self.bkg_counts, self.alpha)
+
+        func = getattr(stats, name)
+        grad = getattr(stats, name + "_grad")(self.counts, self.model, *args)
+
+        assert np.allclose(grad, self._numerical_grad(func, *args),
+                           rtol=1e-5, atol=1e-6)
+
+    @pytest.mark.parametrize("name", ["poisson_loglike", "cash", "cstat",
+                                      "chi2"])
+    def test_batched_models(self, name):
+        func = getattr(stats, name)
+        model = np.outer([0.5, 1.0, 2.0], self.model)
+
+        stat = func(self.counts, model)
+
+        assert stat.shape == (3,)
+        for m, s in zip(model, stat):
+            assert np.isclose(func(self.counts, m), s)
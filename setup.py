@@ -28,11 +28,14 @@ setup(
     ],
     license='GPL',
     install_requires=[
-        'numpy>=1.10',
+        'numpy>=1.13',
+        'scipy>=0.19',
         'astropy>=1.0.0',
+        'futures; python_version < "3"',
     ],
     extras_require={
-        'docs': ['numpydoc']
+        'docs': ['numpydoc'],
+        'numba': ['numba']
     }
 )
 